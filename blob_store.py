@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+blob_store.py --- Content-addressed storage for large text blobs (OCR text).
+Version: 1.0.0
+
+Each blob is stored once, gzip-compressed, under ./data/blobs/<aa>/<sha256>.txt.gz
+and referred to by "sha256:<hex digest>". The global complete_data.json keeps only
+these references, so it stays small no matter how much OCR text the corpus has.
+"""
+
+import os
+import gzip
+import hashlib
+
+BLOB_DIR = "./data/blobs"
+REF_PREFIX = "sha256:"
+
+
+def text_ref(text):
+    return REF_PREFIX + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def blob_path(ref, blob_dir=BLOB_DIR):
+    digest = ref[len(REF_PREFIX):]
+    return os.path.join(blob_dir, digest[:2], digest + ".txt.gz")
+
+
+def put_text(text, blob_dir=BLOB_DIR):
+    """
+    Stores text (if not already stored) and returns its reference.
+    """
+    ref = text_ref(text)
+    path = blob_path(ref, blob_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    return ref
+
+
+def get_text(ref, blob_dir=BLOB_DIR):
+    """
+    Returns the text for ref, or "" if ref is empty or the blob is missing.
+    """
+    if not ref:
+        return ""
+    path = blob_path(ref, blob_dir)
+    if not os.path.exists(path):
+        print(f"[blob_store] Missing blob for {ref}")
+        return ""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def load_ocr_text(record, blob_dir=BLOB_DIR):
+    """
+    Lazy loader for a global record's OCR text. Works for both records that still
+    carry an inline 'ocr_text' and records holding an 'ocr_text_ref'.
+    """
+    if record.get("ocr_text"):
+        return record["ocr_text"]
+    return get_text(record.get("ocr_text_ref", ""), blob_dir)
+
+
+def with_ocr_text(record, blob_dir=BLOB_DIR):
+    """
+    Returns a copy of record with 'ocr_text' filled in from the blob store.
+    """
+    hydrated = dict(record)
+    hydrated["ocr_text"] = load_ocr_text(record, blob_dir)
+    return hydrated
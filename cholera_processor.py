@@ -1,59 +1,157 @@
 #!/usr/bin/env python3
 """
 cholera_processor.py --- Processes cholera death records by copying PDFs and updating a JSON file.
-Version: 1.2.0
+Version: 1.5.0
+
+Syncing is incremental: ./data/cholera_manifest.json records how many records of the
+cholera stage's output (deepseek_yes_no_response.json) it has consumed, the filenames
+currently cholera-positive and the PDFs it placed in ./cholera_positive. A run only
+reads the records the cholera stage added since, and adds or removes just the changed
+filenames in ./cholera_positive and ./data/cholera_deaths.json; the global file is
+only scanned to look up newly positive records. PDFs are hardlinked (or reflinked)
+from ./death_certificates when possible and copied otherwise. Run with --full to
+rebuild from the directory.
 """
 
 import os
 import json
 import shutil
+import argparse
+from blob_store import with_ocr_text
+from record_io import iter_records, stage_path, write_records
 
 GLOBAL_FILE = "./data/complete_data.json"
+CHOLERA_SOURCE = stage_path("./deepseek/deepseek_yes_no_response.json")  # Output from deepseek_cholera_request.py
+MANIFEST_FILE = "./data/cholera_manifest.json"
+SOURCE_PDF_DIR = "./death_certificates"
+CHOLERA_PDF_DIR = "./cholera_positive"
+CHOLERA_JSON = "./data/cholera_deaths.json"
+
+FICLONE = 0x40049409  # Linux ioctl for reflink (copy-on-write clone)
+
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return None
+    return None
 
-def process_cholera_deaths():
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def reflink(src_path, dst_path):
+    import fcntl
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def link_or_copy(src_path, dst_path):
     """
-    Processes the complete_data.json to filter out cholera death records,
-    ensures that the ./cholera_positive directory contains only the PDFs corresponding
-    to current cholera-positive records, copies any missing PDFs from ./death_certificates/,
-    and overwrites the JSON file at ./data/cholera_deaths.json with the updated records.
+    Places src_path at dst_path without duplicating bytes where the filesystem allows:
+    a hardlink first, then a reflink, then a regular copy. Returns the method used.
     """
-    cholera_pdf_dir = "./cholera_positive"
-    os.makedirs(cholera_pdf_dir, exist_ok=True)
-
-    # Load the complete_data.json file
     try:
-        with open(GLOBAL_FILE, "r") as f:
-            complete_data = json.load(f)
-    except Exception as e:
-        print("Error reading complete_data.json:", e)
+        os.link(src_path, dst_path)
+        return "linked"
+    except OSError:
+        pass
+    try:
+        reflink(src_path, dst_path)
+        return "reflinked"
+    except (OSError, ImportError):
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+    shutil.copy2(src_path, dst_path)
+    return "copied"
+
+def read_status_changes(skip):
+    """
+    Returns ({filename: cholera-positive} for the cholera stage's records after the
+    first skip, total number of records). Later records for a filename win.
+    """
+    changes, count = {}, 0
+    for record in iter_records(CHOLERA_SOURCE):
+        count += 1
+        if count <= skip:
+            continue
+        filename = record.get("filename")
+        if filename:
+            changes[filename] = str(record.get("cholera_death", "")).lower() == "yes"
+    return changes, count
+
+def global_records(filenames):
+    """
+    The global records for filenames, streamed out of complete_data.json.
+    """
+    if not filenames:
+        return []
+    return [record for record in iter_records(GLOBAL_FILE) if record.get("filename") in filenames]
+
+def process_cholera_deaths(full_resync=False):
+    """
+    Keeps the ./cholera_positive directory holding exactly the PDFs of cholera-positive
+    records (copying missing ones from ./death_certificates/) and ./data/cholera_deaths.json
+    holding their global records. The exported records carry their full ocr_text,
+    loaded from the blob store.
+
+    Only the status changes since the previous run (per the manifest) are applied,
+    unless full_resync is set or there is no manifest yet.
+    """
+    os.makedirs(CHOLERA_PDF_DIR, exist_ok=True)
+
+    if not os.path.exists(GLOBAL_FILE):
+        print(f"Error reading complete_data.json: {GLOBAL_FILE} does not exist")
+        return
+    manifest = None if full_resync else load_manifest()
+    if manifest and "consumed" not in manifest:
+        manifest = None  # written by an older version
+    changes, total = read_status_changes(manifest["consumed"] if manifest else 0)
+    if manifest and total < manifest["consumed"]:
+        # The cholera stage output was rebuilt; start over.
+        manifest = None
+        changes, total = read_status_changes(0)
+
+    previous = set(manifest["positive"]) if manifest else set()
+    positive = set(previous)
+    for filename, is_positive in changes.items():
+        if is_positive:
+            positive.add(filename)
+        else:
+            positive.discard(filename)
+    added, removed = positive - previous, previous - positive
+
+    # What is already in cholera_pdf_dir: from the manifest, or from the directory itself
+    if manifest:
+        synced = set(manifest.get("synced", []))
+    else:
+        synced = {file[:-4] for file in os.listdir(CHOLERA_PDF_DIR) if file.lower().endswith(".pdf")}
+
+    if manifest and not added and not removed and os.path.exists(CHOLERA_JSON):
+        print("No cholera status changes since last sync; nothing to do.")
+        save_manifest({"consumed": total, "positive": sorted(positive), "synced": sorted(synced)})
         return
 
-    # Filter records with cholera_death == "yes" (case-insensitive)
-    cholera_records = [
-        record for record in complete_data
-        if record.get("cholera_death", "").lower() == "yes"
-    ]
-
-    # Build a set of valid base filenames from cholera_records
-    valid_filenames = {record.get("filename", "") for record in cholera_records}
-
-    # Remove any PDFs in cholera_pdf_dir that are not in the valid set
-    for file in os.listdir(cholera_pdf_dir):
-        if file.lower().endswith(".pdf"):
-            base_filename = file[:-4]  # remove ".pdf"
-            if base_filename not in valid_filenames:
-                file_to_remove = os.path.join(cholera_pdf_dir, file)
-                try:
-                    os.remove(file_to_remove)
-                    print(f"Removed outdated file: {file_to_remove}")
-                except Exception as e:
-                    print(f"Error removing file {file_to_remove}: {e}")
-
-    # Copy the PDF files for cholera death records if they don't already exist
-    for record in cholera_records:
-        pdf_filename = record.get("filename", "") + ".pdf"  # Assumes PDF filenames follow this convention
-        src_path = os.path.join("./death_certificates", pdf_filename)
-        dst_path = os.path.join(cholera_pdf_dir, pdf_filename)
+    # Remove any PDFs that are no longer cholera-positive
+    for base_filename in sorted(synced - positive):
+        file_to_remove = os.path.join(CHOLERA_PDF_DIR, base_filename + ".pdf")
+        try:
+            if os.path.exists(file_to_remove):
+                os.remove(file_to_remove)
+                print(f"Removed outdated file: {file_to_remove}")
+            synced.discard(base_filename)
+        except Exception as e:
+            print(f"Error removing file {file_to_remove}: {e}")
+
+    # Link or copy the PDF files for newly positive records
+    for base_filename in sorted(positive - synced):
+        pdf_filename = base_filename + ".pdf"  # Assumes PDF filenames follow this convention
+        src_path = os.path.join(SOURCE_PDF_DIR, pdf_filename)
+        dst_path = os.path.join(CHOLERA_PDF_DIR, pdf_filename)
         if not os.path.exists(src_path):
             print(f"Source PDF not found: {src_path}")
             continue
@@ -61,19 +159,35 @@ def process_cholera_deaths():
             print(f"PDF already exists, skipping: {dst_path}")
         else:
             try:
-                shutil.copy2(src_path, dst_path)
-                print(f"Copied {src_path} to {dst_path}")
+                method = link_or_copy(src_path, dst_path)
+                print(f"{method.capitalize()} {src_path} to {dst_path}")
             except Exception as e:
                 print(f"Error copying {src_path} to {dst_path}: {e}")
+                continue
+        synced.add(base_filename)
 
-    # Overwrite the JSON file with the updated cholera records
-    cholera_json_path = "./data/cholera_deaths.json"
+    # Update the JSON file: keep the unchanged records, drop removed ones, add new ones
     try:
-        with open(cholera_json_path, "w") as f:
-            json.dump(cholera_records, f, indent=4)
-        print(f"Cholera JSON file updated: {cholera_json_path}")
+        if manifest and os.path.exists(CHOLERA_JSON):
+            kept = [record for record in iter_records(CHOLERA_JSON)
+                    if record.get("filename") not in removed and record.get("filename") not in added]
+            new = global_records(added)
+        else:
+            kept, new = [], global_records(positive)
+        write_records(CHOLERA_JSON, kept + [with_ocr_text(record) for record in new], indent=4)
+        print(f"Cholera JSON file updated: {CHOLERA_JSON} (+{len(new)}, -{len(removed)})")
     except Exception as e:
-        print(f"Error writing {cholera_json_path}: {e}")
+        print(f"Error writing {CHOLERA_JSON}: {e}")
+        return
+
+    save_manifest({"consumed": total, "positive": sorted(positive), "synced": sorted(synced)})
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync cholera-positive records and PDFs.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest and resync from the cholera_positive directory.")
+    args = parser.parse_args()
+    process_cholera_deaths(full_resync=args.full)
 
 if __name__ == "__main__":
-    process_cholera_deaths()
+    main()
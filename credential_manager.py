@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+credential_manager.py --- Cached, proactively refreshed Document AI access token.
+Version: 1.0.0
+
+Access tokens from Application Default Credentials expire after about an hour,
+so a token fetched once at startup makes long OCR runs fail with 401s part way
+through. CredentialManager caches the token with its expiry and a background
+thread refreshes it DOCUMENT_AI_TOKEN_REFRESH_MARGIN seconds before it expires,
+so requests keep getting a valid token without waiting on auth. One manager is
+shared by all worker threads of a run (see get_manager()); only one refresh is
+in flight at a time, and callers keep using the current token while it runs.
+
+A pre-issued token in DOCUMENT_AI_ACCESS_TOKEN (e.g. from
+`gcloud auth print-access-token`) skips the ADC lookup; its expiry is unknown,
+so it is used as-is for the whole run.
+
+Configuration:
+    DOCUMENT_AI_TOKEN_REFRESH_MARGIN   seconds before expiry to refresh (default: 300)
+"""
+
+import os
+import time
+import threading
+from datetime import timezone
+import google.auth
+import google.auth.transport.requests
+
+REFRESH_MARGIN = float(os.environ.get("DOCUMENT_AI_TOKEN_REFRESH_MARGIN", "300"))
+REFRESH_RETRY_DELAY = 30  # seconds between background attempts after a failed refresh
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+class CredentialManager:
+    """
+    Hands out a cached access token; calling the manager returns the token, so it
+    can be passed anywhere a token_provider is expected.
+
+    fetch() returns (token, expiry) with expiry as a Unix timestamp, or None if
+    the token does not expire.
+    """
+    def __init__(self, fetch=None, refresh_margin=REFRESH_MARGIN):
+        self.fetch = fetch or self.fetch_default
+        self.refresh_margin = refresh_margin
+        self.credentials = None
+        self.token = None
+        self.expiry = None
+        self.refreshes = 0
+        self.lock = threading.Lock()          # guards token/expiry
+        self.refresh_lock = threading.Lock()  # one refresh at a time
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def fetch_default(self):
+        if os.environ.get("DOCUMENT_AI_ACCESS_TOKEN"):
+            return os.environ["DOCUMENT_AI_ACCESS_TOKEN"], None
+        if self.credentials is None:
+            self.credentials, _ = google.auth.default(scopes=SCOPES)
+        self.credentials.refresh(google.auth.transport.requests.Request())
+        expiry = self.credentials.expiry
+        # google-auth reports expiry as a naive UTC datetime
+        return self.credentials.token, expiry.replace(tzinfo=timezone.utc).timestamp() if expiry else None
+
+    def valid(self, margin=0.0):
+        return self.token is not None and (self.expiry is None or time.time() < self.expiry - margin)
+
+    def get_token(self):
+        with self.lock:
+            if self.valid():
+                return self.token
+        # No token yet, or the background refresh did not keep up: refresh now.
+        return self.refresh(force=False)
+
+    __call__ = get_token
+
+    def refresh(self, force=True):
+        """
+        Fetches a new token and returns it. Unless force is set, a token another
+        thread refreshed in the meantime is returned instead.
+        """
+        with self.refresh_lock:
+            with self.lock:
+                if not force and self.valid():
+                    return self.token
+            token, expiry = self.fetch()
+            with self.lock:
+                self.token, self.expiry = token, expiry
+                self.refreshes += 1
+            if expiry is not None:
+                print(f"Document AI access token refreshed, valid until "
+                      f"{time.strftime('%H:%M:%S', time.localtime(expiry))}")
+                self.start()
+            return token
+
+    def start(self):
+        if self.thread is None and not self.stopped.is_set():
+            self.thread = threading.Thread(target=self.run, name="token-refresh", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                expiry = self.expiry
+            if expiry is None:
+                return
+            remaining = expiry - time.time()
+            # Short-lived tokens are refreshed half way through instead.
+            wait = max(remaining - self.refresh_margin, remaining / 2, 1.0)
+            if self.stopped.wait(wait):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                # The current token may still be valid; try again shortly.
+                print(f"Background token refresh failed: {e}")
+                self.stopped.wait(REFRESH_RETRY_DELAY)
+
+    def stop(self):
+        self.stopped.set()
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """
+    The process-wide CredentialManager. No token is fetched until it is first called.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = CredentialManager()
+        return _manager
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+dead_letters.py --- Persistent queue of records a stage failed to process.
+Version: 1.0.1
+
+When a remote call for a record still fails after retry_policy.py's retries, the
+stage records (filename, stage, error) in ./data/dead_letters.json; the entry is
+removed once a later run processes the record. Running the pipeline with
+--retry-failed (or document_ai_processor with RETRY_FAILED_ONLY=1) only sends
+the queued PDFs to OCR, instead of rescanning everything to rediscover the gaps.
+The Deepseek stages are incremental: queued records are missing from their
+output, so every run retries them.
+
+Examples:
+    python dead_letters.py                          # list queued failures
+    python dead_letters.py --clear deepseek_request # drop a stage's entries
+"""
+
+import os
+import json
+import time
+import argparse
+
+DEAD_LETTER_FILE = "./data/dead_letters.json"
+
+def retry_only():
+    """
+    True when stages should only process the records in the queue.
+    """
+    return os.environ.get("RETRY_FAILED_ONLY") == "1"
+
+def load_entries():
+    if os.path.exists(DEAD_LETTER_FILE):
+        with open(DEAD_LETTER_FILE, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return []
+    return []
+
+def save_entries(entries):
+    os.makedirs(os.path.dirname(DEAD_LETTER_FILE), exist_ok=True)
+    tmp_path = DEAD_LETTER_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp_path, DEAD_LETTER_FILE)
+
+class DeadLetterQueue:
+    """
+    The queued failures of one stage.
+    """
+    def __init__(self, stage):
+        self.stage = stage
+        self.entries = {entry["filename"]: entry for entry in load_entries() if entry.get("stage") == stage}
+
+    def filenames(self):
+        return set(self.entries)
+
+    def fail(self, filename, error):
+        entry = self.entries.get(filename) or {"filename": filename, "stage": self.stage, "attempts": 0,
+                                               "first_failed": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        entry.update({"error": str(error), "attempts": entry["attempts"] + 1,
+                      "last_failed": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        self.entries[filename] = entry
+        self.save()
+        print(f"Queued {filename} for retry ({self.stage}): {error}")
+
+    def resolve(self, filename):
+        if self.entries.pop(filename, None) is not None:
+            self.save()
+
+    def save(self):
+        # Other stages' entries are kept as they are on disk.
+        others = [entry for entry in load_entries() if entry.get("stage") != self.stage]
+        save_entries(others + sorted(self.entries.values(), key=lambda entry: entry["filename"]))
+
+    def summary(self):
+        if not self.entries:
+            return ""
+        return f"{len(self.entries)} {self.stage} records in the dead-letter queue ({DEAD_LETTER_FILE})"
+
+def main():
+    parser = argparse.ArgumentParser(description="List or clear the dead-letter queue.")
+    parser.add_argument("--clear", metavar="STAGE", help="Remove all queued entries of STAGE.")
+    args = parser.parse_args()
+
+    entries = load_entries()
+    if args.clear:
+        kept = [entry for entry in entries if entry.get("stage") != args.clear]
+        save_entries(kept)
+        print(f"Removed {len(entries) - len(kept)} {args.clear} entries.")
+        return
+    for entry in entries:
+        print(f"{entry['stage']}\t{entry['filename']}\t{entry['attempts']}x\t{entry['error']}")
+    print(f"{len(entries)} queued failures")
+
+if __name__ == "__main__":
+    main()
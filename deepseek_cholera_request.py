@@ -1,36 +1,16 @@
 #!/usr/bin/env python3
 """
 deepseek_cholera_request.py --- Determines if cause of death is related to cholera via fuzzy keyword search.
-Version: 1.3.0
+Version: 1.4.1
 
 Processes deepseek_response.json one record at a time, checking the cause_of_death for cholera-related keywords
 using fuzzy matching to account for minor misspellings, and adds the cause_of_death and cholera_death result ('yes', 'no', or 'unknown') to the output.
 """
 
-import os
-import json
 import re
 import difflib
 from global_updater import update_global_file
-
-def ensure_directory_exists(file_path):
-    directory = os.path.dirname(file_path)
-    if directory and not os.path.exists(directory):
-        os.makedirs(directory, exist_ok=True)
-
-def load_json_data(file_path):
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as file:
-            try:
-                return json.load(file)
-            except json.JSONDecodeError:
-                return []
-    return []
-
-def save_responses(response_data, file_path):
-    ensure_directory_exists(file_path)
-    with open(file_path, "w", encoding="utf-8") as out_file:
-        json.dump(response_data, out_file, indent=2)
+from record_io import StageOutput, iter_records, stage_path
 
 def fuzzy_in_text(keyword, text, threshold=0.8):
     """
@@ -81,11 +61,11 @@ def check_cholera_keywords(cause):
     return "unknown"
 
 def main():
-    input_file = "./deepseek/deepseek_response.json"
-    output_file = "./deepseek/deepseek_yes_no_response.json"
+    input_file = stage_path("./deepseek/deepseek_response.json")
+    output_file = stage_path("./deepseek/deepseek_yes_no_response.json")
 
-    deepseek_records = load_json_data(input_file)
-    yes_no_responses = load_json_data(output_file)
+    deepseek_records = iter_records(input_file)
+    yes_no_responses = StageOutput(output_file)
 
     processed_files = {entry.get("filename") for entry in yes_no_responses if "filename" in entry}
 
@@ -110,8 +90,7 @@ def main():
         yes_no_responses.append(output_entry)
         processed_files.add(filename)
 
-        save_responses(yes_no_responses, output_file)
-        update_global_file(output_file)
+        update_global_file(output_file, records=[output_entry])
 
         print(f"Cholera check response for {filename} saved.")
 
@@ -1,35 +1,33 @@
 #!/usr/bin/env python3
 """
 deepseek_name_request.py --- Extracts person's name from the OCR text via Deepseek model.
-Version: 1.0.1
+Version: 1.5.2
 
 Reads OCR data from ./ocr/transcribed_json.json, sends a prompt to the Deepseek model
 to identify only the person's name of the deceased, and saves results to
 ./deepseek/deepseek_names.json, then updates the global data file.
+With STAGE_FORMAT=jsonl both files use the .jsonl (JSON Lines) variant.
+Requests go through ollama_client.py (streamed, stopped once the answer is complete).
+Names that rule_extractor.py can read from the printed form with enough confidence
+are saved without asking the model. The rest go to a small model first and are
+escalated to deepseek-r1:32b when it does not return a plausible name.
+Records whose request still fails after retries go to the dead-letter queue
+(dead_letters.py). They are not in the stage output, so the next run retries
+them along with any record that is new upstream (e.g. recovered by OCR).
 """
 
-import os
 import json
 import requests
 from global_updater import update_global_file
+from record_io import StageOutput, iter_records, stage_path
+from ollama_client import OLLAMA_URL, TieredDispatcher, stats
+from rule_extractor import ExtractionStats, extract as rule_extract, score_name
+from dead_letters import DeadLetterQueue
 
-def ensure_directory_exists(file_path):
-    directory = os.path.dirname(file_path)
-    if directory and not os.path.exists(directory):
-        os.makedirs(directory, exist_ok=True)
+RULE_SAVE_EVERY = 100  # rule-extracted names are saved in groups; they take no model time
 
 def load_ocr_data(ocr_file_path):
-    with open(ocr_file_path, "r", encoding="utf-8") as file:
-        return json.load(file)
-
-def load_deepseek_name_responses(response_file_path):
-    if os.path.exists(response_file_path):
-        with open(response_file_path, "r", encoding="utf-8") as file:
-            try:
-                return json.load(file)
-            except json.JSONDecodeError:
-                return []
-    return []
+    return iter_records(ocr_file_path)
 
 def build_name_prompt(ocr_record):
     ocr_data_str = json.dumps(ocr_record.get("ocr_text", ""), indent=2)
@@ -53,10 +51,17 @@ def build_json_schema():
         }
     }
 
-def send_generate_request(payload, url):
-    response = requests.post(url, json=payload)
-    response.raise_for_status()
-    return response.json()
+def first_object(parsed_response):
+    if isinstance(parsed_response, list) and len(parsed_response) > 0:
+        return parsed_response[0]
+    if isinstance(parsed_response, dict):
+        return parsed_response
+    return {}
+
+def valid_name(parsed_response):
+    result_obj = first_object(parsed_response)
+    person_name = result_obj.get("person_name") if isinstance(result_obj, dict) else None
+    return isinstance(person_name, str) and score_name(person_name.strip()) > 0
 
 def parse_model_response(api_result):
     raw_response = api_result.get("response", "").strip()
@@ -66,58 +71,65 @@ def parse_model_response(api_result):
         print("Failed to parse the 'response' field as JSON:", e)
         return raw_response
 
-def save_name_responses(response_data, response_file_path):
-    ensure_directory_exists(response_file_path)
-    with open(response_file_path, "w", encoding="utf-8") as out_file:
-        json.dump(response_data, out_file, indent=2)
-
 def main():
-    ocr_file_path = "./ocr/transcribed_json.json"
-    response_file_path = "./deepseek/deepseek_names.json"
+    ocr_file_path = stage_path("./ocr/transcribed_json.json")
+    response_file_path = stage_path("./deepseek/deepseek_names.json")
 
     ocr_data = load_ocr_data(ocr_file_path)
-    name_responses = load_deepseek_name_responses(response_file_path)
+    name_responses = StageOutput(response_file_path)
 
     # 1) Remove any duplicates in name_responses itself (if they exist from older runs).
-    unique_entries = {}
-    for entry in name_responses:
-        filename = entry.get("filename")
-        if filename and filename not in unique_entries:
-            unique_entries[filename] = entry
-    name_responses = list(unique_entries.values())
+    #    JSON Lines outputs are append-only; duplicates there are skipped in step 2.
+    if name_responses.records is not None:
+        unique_entries = {}
+        for entry in name_responses.records:
+            filename = entry.get("filename")
+            if filename and filename not in unique_entries:
+                unique_entries[filename] = entry
+        name_responses.records = list(unique_entries.values())
 
     # 2) Build a set of already-processed filenames
     processed_files = {entry.get("filename") for entry in name_responses if "filename" in entry}
 
-    url = "http://127.0.0.1:11434/api/generate"
+    dispatcher = TieredDispatcher(OLLAMA_URL)
     json_schema = build_json_schema()
+    dead_letters = DeadLetterQueue("deepseek_name_request")
+
+    def save_rule_names(entries):
+        name_responses.extend(entries)
+        for entry in entries:
+            dead_letters.resolve(entry["filename"])
+        update_global_file(response_file_path, records=entries)
 
+    rule_names = []
+    extraction_stats = ExtractionStats()
     for record in ocr_data:
         filename = record.get("filename")
         if not filename:
             continue
         if filename in processed_files:
             print(f"Skipping already processed file: {filename}")
+            dead_letters.resolve(filename)
+            continue
+
+        values = rule_extract(record, ["person_name"])
+        extraction_stats.record(values is not None)
+        if values is not None:
+            rule_names.append({"filename": filename, "person_name": values["person_name"]})
+            processed_files.add(filename)
+            if len(rule_names) >= RULE_SAVE_EVERY:
+                save_rule_names(rule_names)
+                rule_names = []
             continue
 
         print(f"Extracting name for file: {filename}")
         prompt = build_name_prompt(record)
-        payload = {
-            "model": "deepseek-r1:32b",
-            "prompt": prompt,
-            "stream": False,
-            "format": json_schema
-        }
 
         try:
-            api_result = send_generate_request(payload, url)
-            parsed_response = parse_model_response(api_result)
-
-            if isinstance(parsed_response, list) and len(parsed_response) > 0:
-                result_obj = parsed_response[0]
-            elif isinstance(parsed_response, dict):
-                result_obj = parsed_response
-            else:
+            parsed_response, _ = dispatcher.generate(prompt, json_schema, validate=valid_name,
+                                                     parse=parse_model_response)
+            result_obj = first_object(parsed_response)
+            if not isinstance(result_obj, dict):
                 result_obj = {}
 
             output_entry = {
@@ -125,19 +137,33 @@ def main():
                 "person_name": result_obj.get("person_name", "")
             }
 
+            # Save to deepseek_names.json
             name_responses.append(output_entry)
             processed_files.add(filename)
 
-            # Save to deepseek_names.json
-            save_name_responses(name_responses, response_file_path)
             # Update the global file
-            update_global_file(response_file_path)
+            update_global_file(response_file_path, records=[output_entry])
+            dead_letters.resolve(filename)
 
             print(f"Name extraction for {filename} saved.")
         except requests.exceptions.RequestException as e:
             print(f"An error occurred while sending the request for file {filename}: {e}")
+            dead_letters.fail(filename, e)
         except Exception as e:
             print(f"An unexpected error occurred for file {filename}: {e}")
+            dead_letters.fail(filename, e)
+
+    if rule_names:
+        save_rule_names(rule_names)
+
+    if extraction_stats.summary():
+        print(extraction_stats.summary())
+    if stats.summary():
+        print(stats.summary())
+    if dispatcher.summary():
+        print(dispatcher.summary())
+    if dead_letters.summary():
+        print(dead_letters.summary())
 
 if __name__ == "__main__":
     main()
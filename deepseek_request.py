@@ -2,31 +2,43 @@
 """
 deepseek_request.py --- Sends an HTTP request to the Deepseek model via Ollama,
 extracting structured response for death_date, death_location, and cause_of_death.
-Version: 1.1.4
+Version: 1.7.4
+
+Requests go through ollama_client.py, which streams the answer and stops the
+generation once the JSON object is complete.
+
+With DEEPSEEK_BATCH_SIZE=K (> 1) K records are sent in one prompt, so the
+instructions and per-request overhead are paid once per batch. The model returns
+one object per record keyed by filename. Only the records whose entries are
+missing or invalid are escalated to the next model tier; records still without
+an answer are retried as single-record requests on the last tier.
+
+Records whose printed fields rule_extractor.py can read with enough confidence
+are answered without the model at all. The rest go to a small model first (see
+ollama_client.TieredDispatcher); answers without a death date in 1865-1867 or
+without a cause of death are escalated to deepseek-r1:32b.
+
+Records whose request still fails after retries go to the dead-letter queue
+(dead_letters.py). They are not in the stage output, so the next run retries
+them along with any record that is new upstream (e.g. recovered by OCR).
 """
 
 import os
 import json
 import requests
 from global_updater import update_global_file
+from record_io import StageOutput, iter_records, stage_path
+from ollama_client import OLLAMA_URL, TieredDispatcher, matches_schema, stats
+from rule_extractor import YEAR_RANGE, ExtractionStats, extract as rule_extract
+from normalize_records import normalize_date
+from dead_letters import DeadLetterQueue
 
-def ensure_directory_exists(file_path):
-    directory = os.path.dirname(file_path)
-    if directory and not os.path.exists(directory):
-        os.makedirs(directory, exist_ok=True)
+BATCH_SIZE = int(os.environ.get("DEEPSEEK_BATCH_SIZE", "1"))
+FIELDS = ["death_date", "death_location", "cause_of_death"]
+RULE_SAVE_EVERY = 100  # rule-extracted results are saved in groups; they take no model time
 
 def load_ocr_data(ocr_file_path):
-    with open(ocr_file_path, "r", encoding="utf-8") as file:
-        return json.load(file)
-
-def load_deepseek_responses(response_file_path):
-    if os.path.exists(response_file_path):
-        with open(response_file_path, "r", encoding="utf-8") as file:
-            try:
-                return json.load(file)
-            except json.JSONDecodeError:
-                return []
-    return []
+    return iter_records(ocr_file_path)
 
 def build_prompt(ocr_record):
     ocr_data_str = json.dumps(ocr_record, indent=2)
@@ -58,10 +70,100 @@ def build_json_schema():
         }
     }
 
-def send_generate_request(payload, url):
-    response = requests.post(url, json=payload)
-    response.raise_for_status()
-    return response.json()
+def build_batch_prompt(ocr_records):
+    records = [{"filename": record.get("filename"), "ocr_text": record.get("ocr_text", "")} for record in ocr_records]
+    prompt = (
+        "Extract the following details from each of the OCR records below (if available):\n"
+        "1. death_date, write the death date in Month Day, Year -- it should be between 1865 and 1867\n"
+        "2. death_location, write a specific location or address of death\n"
+        "3. cause_of_death, write a specific and succinct cause of death\n\n"
+        "Return a JSON array with one object per OCR record, in the same order, containing exactly these keys:\n"
+        "  - filename (copied from the record)\n"
+        "  - death_date\n"
+        "  - death_location\n"
+        "  - cause_of_death\n\n"
+        "Do not include any extra text. Be succinct and concise.\n\n"
+        "OCR Records:\n" + json.dumps(records, indent=2)
+    )
+    return prompt
+
+def build_batch_schema():
+    schema = build_json_schema()
+    schema["items"]["properties"] = {"filename": {"type": "string"}, **schema["items"]["properties"]}
+    schema["items"]["required"] = ["filename"] + schema["items"]["required"]
+    return schema
+
+def split_batch_response(parsed_response, filenames):
+    """
+    Maps filename -> result object for the valid entries of a batched response.
+    Entries for unknown filenames, duplicates and entries failing the schema are dropped.
+    """
+    if not isinstance(parsed_response, list):
+        return {}
+    item_schema = build_batch_schema()["items"]
+    results = {}
+    for entry in parsed_response:
+        if not matches_schema(entry, item_schema):
+            continue
+        filename = entry["filename"]
+        if filename in filenames and filename not in results:
+            results[filename] = entry
+    return results
+
+def ordered_result(filename, result_obj):
+    return {
+        "filename": filename,
+        "death_date": result_obj.get("death_date", ""),
+        "death_location": result_obj.get("death_location", ""),
+        "cause_of_death": result_obj.get("cause_of_death", "")
+    }
+
+def valid_result(result_obj):
+    """
+    True if an answer has a death date in 1865-1867 and a cause of death.
+    """
+    if not matches_schema(result_obj, build_json_schema()["items"]):
+        return False
+    iso = normalize_date(result_obj["death_date"])
+    return bool(iso) and YEAR_RANGE[0] <= int(iso[:4]) <= YEAR_RANGE[1] and bool(result_obj["cause_of_death"].strip())
+
+def first_object(parsed_response):
+    if isinstance(parsed_response, list) and len(parsed_response) > 0:
+        return parsed_response[0]
+    if isinstance(parsed_response, dict):
+        return parsed_response
+    return {}
+
+def extract_single(record, dispatcher, json_schema, models=None):
+    parsed_response, _ = dispatcher.generate(build_prompt(record), json_schema,
+                                             validate=lambda parsed: valid_result(first_object(parsed)),
+                                             parse=parse_model_response, models=models)
+    result_obj = first_object(parsed_response)
+    if not isinstance(result_obj, dict):
+        result_obj = {}
+    return ordered_result(record.get("filename"), result_obj)
+
+def extract_batch(records, dispatcher):
+    """
+    Returns (results, failed_records) for one batched request.
+    """
+    by_filename = {record.get("filename"): record for record in records}
+
+    def prompt(filenames):
+        return build_batch_prompt([by_filename[filename] for filename in filenames])
+
+    try:
+        found = dispatcher.generate_batch(list(by_filename), prompt, build_batch_schema(),
+                                          split=split_batch_response, validate=valid_result,
+                                          parse=parse_model_response)
+    except Exception as e:
+        # e.g. a malformed stream line; the records fall back to single requests.
+        print(f"An unexpected error occurred for a batch of {len(records)} files: {e}")
+        found = {}
+    results = [ordered_result(record.get("filename"), found[record.get("filename")])
+               for record in records if record.get("filename") in found]
+    failed = [record for record in records if record.get("filename") not in found]
+    return results, failed
 
 def parse_model_response(api_result):
     raw_response = api_result.get("response", "").strip()
@@ -72,68 +174,95 @@ def parse_model_response(api_result):
         print("Failed to parse the 'response' field as JSON:", e)
         return raw_response
 
-def save_responses(response_data, response_file_path):
-    ensure_directory_exists(response_file_path)
-    with open(response_file_path, "w", encoding="utf-8") as out_file:
-        json.dump(response_data, out_file, indent=2)
-
 def main():
-    ocr_file_path = "./ocr/transcribed_json.json"
-    response_file_path = "./deepseek/deepseek_response.json"
+    ocr_file_path = stage_path("./ocr/transcribed_json.json")
+    response_file_path = stage_path("./deepseek/deepseek_response.json")
 
     ocr_data = load_ocr_data(ocr_file_path)
-    deepseek_responses = load_deepseek_responses(response_file_path)
+    deepseek_responses = StageOutput(response_file_path)
     processed_files = {entry.get("filename") for entry in deepseek_responses if "filename" in entry}
 
-    url = "http://127.0.0.1:11434/api/generate"
+    dispatcher = TieredDispatcher(OLLAMA_URL)
     json_schema = build_json_schema()
+    dead_letters = DeadLetterQueue("deepseek_request")
 
-    for record in ocr_data:
-        filename = record.get("filename")
-        if not filename:
-            continue
-        if filename in processed_files:
-            print(f"Skipping already processed file: {filename}")
-            continue
+    def save(results):
+        deepseek_responses.extend(results)
+        processed_files.update(result["filename"] for result in results)
+        for result in results:
+            dead_letters.resolve(result["filename"])
+        # Immediately update the global file
+        update_global_file(response_file_path, records=results)
 
+    def process_single(record, models=None):
+        filename = record.get("filename")
         print(f"Processing OCR for file: {filename}")
-        prompt = build_prompt(record)
-        payload = {
-            "model": "deepseek-r1:32b",
-            "prompt": prompt,
-            "stream": False,
-            "format": json_schema
-        }
-
         try:
-            api_result = send_generate_request(payload, url)
-            parsed_response = parse_model_response(api_result)
-            if isinstance(parsed_response, list) and len(parsed_response) > 0:
-                result_obj = parsed_response[0]
-            elif isinstance(parsed_response, dict):
-                result_obj = parsed_response
-            else:
-                result_obj = {}
-
-            ordered_result = {
-                "filename": filename,
-                "death_date": result_obj.get("death_date", ""),
-                "death_location": result_obj.get("death_location", ""),
-                "cause_of_death": result_obj.get("cause_of_death", "")
-            }
-
-            deepseek_responses.append(ordered_result)
-            processed_files.add(filename)
-
-            save_responses(deepseek_responses, response_file_path)
-            # Immediately update the global file
-            update_global_file(response_file_path)
-
+            save([extract_single(record, dispatcher, json_schema, models)])
             print(f"Deepseek response for {filename} saved.")
         except requests.exceptions.RequestException as e:
             print(f"An error occurred while sending the request for file {filename}: {e}")
+            dead_letters.fail(filename, e)
         except Exception as e:
             print(f"An unexpected error occurred for file {filename}: {e}")
+            dead_letters.fail(filename, e)
+
+    def process_batch(records):
+        print(f"Processing OCR for {len(records)} files in one request")
+        results, failed = extract_batch(records, dispatcher)
+        if results:
+            save(results)
+            print(f"Deepseek responses for {len(results)} files saved.")
+        # These records already failed in a batched request; retry them one by
+        # one on the last tier only.
+        for record in failed:
+            process_single(record, models=dispatcher.models[-1:])
+        return len(failed)
+
+    fallbacks = 0
+    batch = []
+    rule_results = []
+    queued = set()
+    extraction_stats = ExtractionStats()
+    for record in ocr_data:
+        filename = record.get("filename")
+        if not filename:
+            continue
+        if filename in processed_files or filename in queued:
+            print(f"Skipping already processed file: {filename}")
+            dead_letters.resolve(filename)
+            continue
+        values = rule_extract(record, FIELDS)
+        extraction_stats.record(values is not None)
+        queued.add(filename)
+        if values is not None:
+            rule_results.append(ordered_result(filename, values))
+            if len(rule_results) >= RULE_SAVE_EVERY:
+                save(rule_results)
+                rule_results = []
+            continue
+        if BATCH_SIZE <= 1:
+            process_single(record)
+            continue
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            fallbacks += process_batch(batch)
+            batch = []
+    if batch:
+        fallbacks += process_batch(batch)
+    if rule_results:
+        save(rule_results)
+
+    if BATCH_SIZE > 1:
+        print(f"Batches of {BATCH_SIZE}: {fallbacks} records fell back to single requests.")
+    if extraction_stats.summary():
+        print(extraction_stats.summary())
+    if stats.summary():
+        print(stats.summary())
+    if dispatcher.summary():
+        print(dispatcher.summary())
+    if dead_letters.summary():
+        print(dead_letters.summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+document_ai_batch.py --- Document AI batch processing for large OCR backlogs.
+Version: 1.1.1
+
+Instead of one online :process call per PDF, pending PDFs are uploaded to Cloud
+Storage and submitted in groups of up to BATCH_MAX_DOCUMENTS to the processor's
+:batchProcess endpoint. The long-running operations are polled until they finish,
+and their output documents are downloaded and handed back per job, so
+document_ai_processor.py can save each job's results to transcribed_json.json in
+one go.
+
+Submitted jobs are recorded in ./ocr/batch_jobs.json until their results have been
+ingested, so an interrupted run picks up the running jobs instead of resubmitting
+the PDFs. Uploaded inputs and job outputs stay in the bucket; use a bucket
+lifecycle rule to expire them.
+
+Configuration:
+    DOCUMENT_AI_BATCH_BUCKET    gs://bucket/prefix for inputs and outputs (required)
+    DOCUMENT_AI_BATCH_SIZE      documents per batch job (default: 1000)
+    DOCUMENT_AI_POLL_INTERVAL   seconds between operation polls (default: 30)
+    GCS_API_URL                 Cloud Storage JSON API root (default: https://storage.googleapis.com)
+
+Run on its own to check on recorded jobs:
+    python document_ai_batch.py --status
+"""
+
+import os
+import json
+import time
+import argparse
+import requests
+import retry_policy
+from urllib.parse import quote, urlparse
+from concurrent.futures import ThreadPoolExecutor
+from ocr_backends import OCRResult, document_confidence
+
+BATCH_BUCKET = os.environ.get("DOCUMENT_AI_BATCH_BUCKET", "")
+BATCH_MAX_DOCUMENTS = int(os.environ.get("DOCUMENT_AI_BATCH_SIZE", "1000"))
+POLL_INTERVAL = float(os.environ.get("DOCUMENT_AI_POLL_INTERVAL", "30"))
+GCS_API_URL = os.environ.get("GCS_API_URL", "https://storage.googleapis.com")
+JOBS_FILE = "./ocr/batch_jobs.json"
+UPLOAD_WORKERS = 8
+
+def split_gcs_uri(uri):
+    """
+    "gs://bucket/some/prefix" -> ("bucket", "some/prefix")
+    """
+    if not uri.startswith("gs://"):
+        raise ValueError(f"Not a gs:// URI: {uri}")
+    bucket, _, name = uri[len("gs://"):].partition("/")
+    return bucket, name.strip("/")
+
+def batch_endpoint(endpoint_url):
+    """
+    The :batchProcess URL for a processor's :process endpoint.
+    """
+    return endpoint_url.replace(":process", ":batchProcess")
+
+def operation_url(endpoint_url, operation_name):
+    url = urlparse(endpoint_url)
+    return f"{url.scheme}://{url.netloc}/v1/{operation_name}"
+
+class StorageClient:
+    """
+    Minimal Cloud Storage JSON API client (upload, list, download).
+    """
+    def __init__(self, token_provider, api_url=GCS_API_URL):
+        self.token_provider = token_provider
+        self.api_url = api_url.rstrip("/")
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token_provider()}"}
+
+    def upload(self, bucket, name, data, content_type="application/pdf"):
+        response = retry_policy.request(
+            "post", f"{self.api_url}/upload/storage/v1/b/{bucket}/o", label=f"Upload {name}",
+            params={"uploadType": "media", "name": name},
+            headers={**self.headers(), "Content-Type": content_type},
+            data=data
+        )
+        response.raise_for_status()
+
+    def list(self, bucket, prefix):
+        names, page_token = [], None
+        while True:
+            params = {"prefix": prefix}
+            if page_token:
+                params["pageToken"] = page_token
+            response = retry_policy.request("get", f"{self.api_url}/storage/v1/b/{bucket}/o", label=f"List {prefix}",
+                                            params=params, headers=self.headers())
+            response.raise_for_status()
+            data = response.json()
+            names.extend(item["name"] for item in data.get("items", []))
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                return names
+
+    def download(self, bucket, name):
+        response = retry_policy.request(
+            "get", f"{self.api_url}/storage/v1/b/{bucket}/o/{quote(name, safe='')}", label=f"Download {name}",
+            params={"alt": "media"},
+            headers=self.headers()
+        )
+        response.raise_for_status()
+        return response.content
+
+def load_jobs():
+    if os.path.exists(JOBS_FILE):
+        with open(JOBS_FILE, "r", encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return []
+    return []
+
+def save_jobs(jobs):
+    os.makedirs(os.path.dirname(JOBS_FILE), exist_ok=True)
+    tmp_path = JOBS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(jobs, f, indent=2)
+    os.replace(tmp_path, JOBS_FILE)
+
+class BatchProcessor:
+    """
+    Submits PDFs as Document AI batch jobs and collects their results.
+    """
+    def __init__(self, endpoint_url, token_provider, bucket_uri=BATCH_BUCKET,
+                 max_documents=BATCH_MAX_DOCUMENTS, poll_interval=POLL_INTERVAL, storage=None):
+        if not bucket_uri:
+            raise ValueError("Batch mode needs DOCUMENT_AI_BATCH_BUCKET (gs://bucket/prefix).")
+        self.endpoint_url = endpoint_url
+        self.token_provider = token_provider
+        self.bucket, self.prefix = split_gcs_uri(bucket_uri)
+        self.max_documents = max_documents
+        self.poll_interval = poll_interval
+        self.storage = storage or StorageClient(token_provider)
+
+    def object_name(self, *parts):
+        return "/".join(part for part in (self.prefix, *parts) if part)
+
+    def submit(self, pdf_paths):
+        """
+        Uploads pdf_paths and starts one batch job for them. Returns the job record
+        kept in JOBS_FILE: the operation name and gs:// input URI -> file base.
+        """
+        run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+        def upload(path):
+            name = self.object_name("input", run_id, os.path.basename(path))
+            with open(path, "rb") as f:
+                self.storage.upload(self.bucket, name, f.read())
+            return f"gs://{self.bucket}/{name}", os.path.splitext(os.path.basename(path))[0]
+
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+            documents = dict(pool.map(upload, pdf_paths))
+
+        payload = {
+            "inputDocuments": {
+                "gcsDocuments": {
+                    "documents": [{"gcsUri": uri, "mimeType": "application/pdf"} for uri in documents]
+                }
+            },
+            "documentOutputConfig": {
+                "gcsOutputConfig": {"gcsUri": f"gs://{self.bucket}/{self.object_name('output', run_id)}"}
+            }
+        }
+        headers = {
+            "Authorization": f"Bearer {self.token_provider()}",
+            "Content-Type": "application/json"
+        }
+        response = retry_policy.request("post", batch_endpoint(self.endpoint_url), label="batchProcess",
+                                        headers=headers, json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"batchProcess failed: {response.status_code} - {response.text}")
+        return {"operation": response.json()["name"], "documents": documents}
+
+    def get_operation(self, operation_name):
+        headers = {"Authorization": f"Bearer {self.token_provider()}"}
+        response = retry_policy.request("get", operation_url(self.endpoint_url, operation_name),
+                                        label=f"Poll {operation_name}", headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    def read_output(self, destination):
+        """
+        Reads the output documents under a gs:// destination and joins their shards.
+        """
+        bucket, prefix = split_gcs_uri(destination)
+        shards = []
+        for name in self.storage.list(bucket, prefix + "/"):
+            if name.endswith(".json"):
+                shards.append(json.loads(self.storage.download(bucket, name)))
+        shards.sort(key=lambda doc: int(doc.get("shardInfo", {}).get("shardIndex", 0)))
+        pages = [page for doc in shards for page in doc.get("pages", [])]
+        text = "".join(doc.get("text", "") for doc in shards)
+        return OCRResult(text, document_confidence({"pages": pages}), "documentai")
+
+    def collect(self, job, operation):
+        """
+        Returns [(file_base, OCRResult or None)] for a finished job.
+        """
+        results = []
+        statuses = operation.get("metadata", {}).get("individualProcessStatuses", [])
+        for status in statuses:
+            file_base = job["documents"].get(status.get("inputGcsSource"))
+            if file_base is None:
+                continue
+            if status.get("status", {}).get("code") or not status.get("outputGcsDestination"):
+                print(f"Batch OCR failed for {file_base}: {status.get('status', {}).get('message', 'no output')}")
+                results.append((file_base, None))
+                continue
+            try:
+                results.append((file_base, self.read_output(status["outputGcsDestination"])))
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error reading batch output for {file_base}: {e}")
+                results.append((file_base, None))
+        return results
+
+    def run(self, pdf_paths):
+        """
+        Processes pdf_paths in batch jobs, after first finishing any jobs recorded
+        by an earlier run. Yields the [(file_base, OCRResult or None)] list of each
+        job as it completes. Files of failed documents are left for the next run.
+        """
+        jobs = load_jobs()
+        in_flight = {file_base for job in jobs for file_base in job["documents"].values()}
+        pending = [path for path in pdf_paths
+                   if os.path.splitext(os.path.basename(path))[0] not in in_flight]
+        if jobs:
+            print(f"Resuming {len(jobs)} batch job(s) from {JOBS_FILE}")
+
+        for start in range(0, len(pending), self.max_documents):
+            chunk = pending[start:start + self.max_documents]
+            job = self.submit(chunk)
+            jobs.append(job)
+            save_jobs(jobs)
+            print(f"Submitted batch job {job['operation']} with {len(chunk)} documents")
+
+        while jobs:
+            for job in list(jobs):
+                operation = self.get_operation(job["operation"])
+                if not operation.get("done"):
+                    continue
+                if "error" in operation:
+                    print(f"Batch job {job['operation']} failed: {operation['error'].get('message', '')}")
+                    results = [(file_base, None) for file_base in job["documents"].values()]
+                else:
+                    results = self.collect(job, operation)
+                    print(f"Batch job {job['operation']} finished "
+                          f"({operation.get('metadata', {}).get('state', 'DONE')})")
+                yield results
+                jobs.remove(job)
+                save_jobs(jobs)
+            if jobs:
+                time.sleep(self.poll_interval)
+
+def main():
+    from document_ai_processor import DOCUMENT_AI_ENDPOINT
+    from credential_manager import get_manager
+
+    parser = argparse.ArgumentParser(description="Show the state of recorded Document AI batch jobs.")
+    parser.add_argument("--status", action="store_true", help="Poll each recorded job once and print its state.")
+    args = parser.parse_args()
+
+    jobs = load_jobs()
+    print(f"{len(jobs)} batch job(s) recorded in {JOBS_FILE}")
+    if args.status and jobs:
+        processor = BatchProcessor(DOCUMENT_AI_ENDPOINT, get_manager(), bucket_uri=BATCH_BUCKET or "gs://unused")
+        for job in jobs:
+            operation = processor.get_operation(job["operation"])
+            state = operation.get("metadata", {}).get("state", "DONE" if operation.get("done") else "RUNNING")
+            print(f"{job['operation']}\t{len(job['documents'])} documents\t{state}")
+
+if __name__ == "__main__":
+    main()
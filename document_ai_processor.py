@@ -1,103 +1,164 @@
 #!/usr/bin/env python3
 """
 document_ai_processor.py --- Process PDFs with Document AI and save OCR results.
-Version: 1.1.2
+Version: 1.7.1
 
 This script reads PDF files from the './death_certificates' directory,
 sends them to a Document AI endpoint for OCR, and saves the result to
-'./ocr/transcribed_json.json'. Then updates the global file.
+'./ocr/transcribed_json.json' (or './ocr/transcribed_json.jsonl' with
+STAGE_FORMAT=jsonl). Then updates the global file.
+
+The OCR engine is chosen with OCR_BACKEND (see ocr_backends.py): Document AI by
+default, local Tesseract, or routed (local first, Document AI for low-confidence
+documents). Credentials are only fetched if a backend actually calls Document AI;
+the access token is cached and refreshed before it expires (see
+credential_manager.py), so long runs keep working past the token lifetime.
+With OCR_SPLIT_PAGES=1 multi-page PDFs are OCR'd page by page in parallel; pages
+that succeeded are cached in ./ocr/pages, so rerunning after a failure only
+resends the failed pages.
+
+Large backlogs can go through Document AI batch jobs instead (see
+document_ai_batch.py). DOCUMENT_AI_MODE (or --mode) picks the path: "online",
+"batch", or "auto" (default), which uses batch jobs when DOCUMENT_AI_BATCH_BUCKET
+is set, the Document AI backend is selected and at least DOCUMENT_AI_BATCH_THRESHOLD
+PDFs are pending (or jobs from an interrupted batch run are still recorded).
+Small incremental runs stay on the online path.
+
+Files that still fail after retry_policy.py's retries are recorded in the
+dead-letter queue (see dead_letters.py); with RETRY_FAILED_ONLY=1 (pipeline.py
+--retry-failed) only those files are processed.
 """
 
 import os
-import base64
-import json
-import requests
-import google.auth
-import google.auth.transport.requests
+import argparse
 from global_updater import update_global_file
+from record_io import StageOutput, stage_path
+from ocr_backends import OCR_BACKEND, get_backend, post_document
+from document_ai_batch import BATCH_BUCKET, BatchProcessor, load_jobs
+from dead_letters import DeadLetterQueue, retry_only
+from credential_manager import get_manager
+
+DOCUMENT_AI_ENDPOINT = os.environ.get(
+    "DOCUMENT_AI_ENDPOINT",
+    "https://us-documentai.googleapis.com/v1/projects/66601296107/locations/us/processors/b33f41abbc1016f2:process"
+)
+DOCUMENT_AI_MODE = os.environ.get("DOCUMENT_AI_MODE", "auto")
+BATCH_THRESHOLD = int(os.environ.get("DOCUMENT_AI_BATCH_THRESHOLD", "500"))
 
 def get_access_token():
-    credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-    auth_req = google.auth.transport.requests.Request()
-    credentials.refresh(auth_req)
-    return credentials.token
+    return get_manager().get_token()
 
 def process_pdf(file_path, access_token, endpoint_url):
     with open(file_path, "rb") as f:
         file_content = f.read()
-    encoded_content = base64.b64encode(file_content).decode("utf-8")
 
-    payload = {
-        "rawDocument": {
-            "content": encoded_content,
-            "mimeType": "application/pdf"
-        }
-    }
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    response = requests.post(endpoint_url, headers=headers, json=payload)
-    if response.status_code != 200:
-        print(f"Error processing {file_path}: {response.status_code} - {response.text}")
+    response_data = post_document(file_content, access_token, endpoint_url, label=file_path)
+    if response_data is None:
         return None
 
-    response_data = response.json()
     ocr_text = response_data.get("document", {}).get("text", "")
     return ocr_text
 
-def main():
-    endpoint_url = "https://us-documentai.googleapis.com/v1/projects/66601296107/locations/us/processors/b33f41abbc1016f2:process"
+def use_batch_mode(mode, pending_count):
+    if mode == "batch":
+        return True
+    if mode == "online":
+        return False
+    if not BATCH_BUCKET or OCR_BACKEND != "documentai":
+        return False
+    # Jobs left by an interrupted batch run are finished in batch mode too.
+    return pending_count >= BATCH_THRESHOLD or bool(load_jobs())
+
+def ocr_record(file_base, ocr_result):
+    print("Filename:", file_base)
+    print(f"OCR Text ({ocr_result.backend}, confidence {ocr_result.confidence:.2f}):")
+    print(ocr_result.text)
+    print("=" * 50)
+    return {
+        "filename": file_base,
+        "ocr_text": ocr_result.text,
+        "ocr_backend": ocr_result.backend,
+        "ocr_confidence": round(ocr_result.confidence, 3)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR the PDFs in ./death_certificates.")
+    parser.add_argument("--mode", choices=["auto", "online", "batch"], default=DOCUMENT_AI_MODE,
+                        help=f"Online requests, batch jobs, or pick by backlog size (default: {DOCUMENT_AI_MODE}).")
+    args = parser.parse_args(argv)
+
+    endpoint_url = DOCUMENT_AI_ENDPOINT
     directory = "./death_certificates"
     output_dir = "./ocr"
     os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, "transcribed_json.json")
+    output_file = stage_path(os.path.join(output_dir, "transcribed_json.json"))
 
-    existing_results = []
-    processed_files = set()
-    if os.path.exists(output_file):
-        with open(output_file, "r", encoding="utf-8") as f:
-            try:
-                existing_results = json.load(f)
-                processed_files = {os.path.splitext(item.get("filename", ""))[0] for item in existing_results}
-            except json.JSONDecodeError:
-                existing_results = []
+    output = StageOutput(output_file, indent=4)
+    processed_files = {os.path.splitext(item.get("filename", ""))[0] for item in output}
 
-    access_token = get_access_token()
-    all_results = existing_results[:]
+    dead_letters = DeadLetterQueue("document_ai_processor")
+    wanted = dead_letters.filenames() if retry_only() else None
 
+    pending = []
     for filename in os.listdir(directory):
         if filename.lower().endswith(".pdf"):
             file_base = os.path.splitext(filename)[0]
+            if wanted is not None and file_base not in wanted:
+                continue
             if file_base in processed_files:
                 print(f"Skipping already processed file: {file_base}")
+                dead_letters.resolve(file_base)
                 continue
-
-            file_path = os.path.join(directory, filename)
-            print(f"Processing file: {filename}")
-            ocr_text = process_pdf(file_path, access_token, endpoint_url)
-            if ocr_text is not None:
-                print("Filename:", file_base)
-                print("OCR Text:")
-                print(ocr_text)
-                print("=" * 50)
-                result = {
-                    "filename": file_base,
-                    "ocr_text": ocr_text
-                }
-                all_results.append(result)
-                processed_files.add(file_base)
-
-                # Write to transcribed_json.json
-                with open(output_file, "w", encoding="utf-8") as f:
-                    json.dump(all_results, f, indent=4)
-
-                # Update the global file
-                update_global_file(output_file)
-
+            pending.append(os.path.join(directory, filename))
+
+    token_provider = get_manager()
+
+    if use_batch_mode(args.mode, len(pending)):
+        print(f"Processing {len(pending)} files in Document AI batch jobs")
+        processor = BatchProcessor(endpoint_url, token_provider)
+        for results in processor.run(pending):
+            for file_base, ocr_result in results:
+                if ocr_result is None:
+                    dead_letters.fail(file_base, "Document AI batch job returned no result")
+                else:
+                    dead_letters.resolve(file_base)
+            records = [ocr_record(file_base, ocr_result) for file_base, ocr_result in results
+                       if ocr_result is not None and file_base not in processed_files]
+            if not records:
+                continue
+            # One save and one global merge per finished job
+            output.extend(records)
+            processed_files.update(record["filename"] for record in records)
+            update_global_file(output_file, records=records)
+        print(f"OCR results saved to {output_file}")
+        if dead_letters.summary():
+            print(dead_letters.summary())
+        return
+
+    backend = get_backend(OCR_BACKEND, endpoint_url=endpoint_url, token_provider=token_provider)
+
+    for file_path in pending:
+        file_base = os.path.splitext(os.path.basename(file_path))[0]
+        print(f"Processing file: {os.path.basename(file_path)}")
+        ocr_result = backend.process_file(file_path)
+        if ocr_result is None:
+            dead_letters.fail(file_base, backend.last_error or "OCR returned no result")
+        else:
+            dead_letters.resolve(file_base)
+            result = ocr_record(file_base, ocr_result)
+            # Write to transcribed_json.json
+            output.append(result)
+            processed_files.add(file_base)
+
+            # Update the global file
+            update_global_file(output_file, records=[result])
+
+    backend.close()
+    if backend.summary():
+        print(backend.summary())
     print(f"OCR results saved to {output_file}")
+    if dead_letters.summary():
+        print(dead_letters.summary())
 
 if __name__ == "__main__":
     main()
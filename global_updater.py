@@ -1,16 +1,28 @@
 #!/usr/bin/env python3
 """
 global_updater.py --- Utility to update the global data file.
-Version: 1.0.0
+Version: 1.3.1
 
 This module centralizes the logic needed to load, merge, and save updates
 to a global JSON file that holds consolidated data from other scripts.
+
+OCR text is not stored inline: merge_records moves it into blob_store and keeps
+an 'ocr_text_ref' in the global record. Use blob_store.load_ocr_text(record) to
+read it back, or set GLOBAL_OCR_TEXT=inline to keep the old inline layout.
+
+Exports of the global file can be written compressed (.gz / .zst):
+    python global_updater.py --export ./exports/complete_data.json.zst --with-ocr-text
 """
 
 import os
 import json
+import argparse
+from record_io import iter_records, load_records, write_records
+from blob_store import put_text, with_ocr_text
 
 GLOBAL_FILE = "./data/complete_data.json"
+EXTERNALIZE_OCR_TEXT = os.environ.get("GLOBAL_OCR_TEXT", "blob").lower() != "inline"
+OCR_TEXT_FIELD = "ocr_text_ref" if EXTERNALIZE_OCR_TEXT else "ocr_text"
 
 def load_json(file_path):
     if os.path.exists(file_path):
@@ -26,14 +38,31 @@ def save_json(data, file_path):
     with open(file_path, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4)
 
+def externalize_ocr_text(record):
+    """
+    Moves an inline 'ocr_text' into the blob store, leaving 'ocr_text_ref' behind.
+    Returns the record (modified in place).
+    """
+    if "ocr_text" in record:
+        text = record.pop("ocr_text")
+        if text:
+            record["ocr_text_ref"] = put_text(text)
+        else:
+            record.setdefault("ocr_text_ref", "")
+    return record
+
 def merge_records(existing, new, key_field="filename", rename_key=None):
     """
     Merge a list of new records into the existing dictionary (keyed by filename).
     Optionally rename a key from the new records (e.g., 'output filename' -> 'filename').
     """
     for record in new:
+        # Work on a copy; callers may still hold the record they passed in.
+        record = dict(record)
         if rename_key and rename_key in record:
             record["filename"] = record.pop(rename_key)
+        if EXTERNALIZE_OCR_TEXT:
+            externalize_ocr_text(record)
         fname = record.get("filename")
         if not fname:
             continue
@@ -46,7 +75,7 @@ def merge_records(existing, new, key_field="filename", rename_key=None):
                 "filename": fname,
                 "person_name": "",
                 "certificate_url": "",
-                "ocr_text": "",
+                OCR_TEXT_FIELD: "",
                 "death_date": "",
                 "death_location": "",
                 "cause_of_death": "",
@@ -56,17 +85,48 @@ def merge_records(existing, new, key_field="filename", rename_key=None):
             existing[fname] = merged
     return existing
 
-def update_global_file(source_file, rename_key=None):
+def update_global_file(source_file, rename_key=None, records=None):
     """
-    Loads data from a source JSON file, merges it into the global complete_data.json,
-    and writes the updated data back out.
+    Loads data from a source JSON or JSON Lines file, merges it into the global
+    complete_data.json, and writes the updated data back out.
+    If records is given, only those records are merged and source_file is not read;
+    the stages pass the records they just saved, so each update neither re-reads
+    their whole output nor re-hashes OCR text that is already in the blob store.
     """
     global_data = load_json(GLOBAL_FILE)
     global_dict = {entry.get("filename"): entry for entry in global_data if entry.get("filename")}
+    if EXTERNALIZE_OCR_TEXT:
+        # Migrates global files written before OCR text moved to the blob store.
+        for entry in global_dict.values():
+            externalize_ocr_text(entry)
 
-    source_data = load_json(source_file)
-    updated_dict = merge_records(global_dict, source_data, rename_key=rename_key)
+    if records is None:
+        records = load_records(source_file)
+    updated_dict = merge_records(global_dict, records, rename_key=rename_key)
 
     merged_list = list(updated_dict.values())
     save_json(merged_list, GLOBAL_FILE)
     print(f"[global_updater] Updated global file from {source_file}")
+
+def export_global_file(dest, with_text=False, indent=4):
+    """
+    Streams the global file to dest; JSON/JSON Lines and compression follow dest's
+    extension (see record_io). With with_text, OCR text is loaded back into each record.
+    """
+    records = iter_records(GLOBAL_FILE)
+    if with_text:
+        records = (with_ocr_text(record) for record in records)
+    write_records(dest, records, indent=indent)
+    print(f"[global_updater] Exported {GLOBAL_FILE} to {dest}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the global data file.")
+    parser.add_argument("--export", required=True, metavar="PATH",
+                        help="Destination, e.g. complete_data.json.gz or complete_data.jsonl.zst.")
+    parser.add_argument("--with-ocr-text", action="store_true",
+                        help="Include the full OCR text from the blob store in each record.")
+    args = parser.parse_args()
+    export_global_file(args.export, with_text=args.with_ocr_text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+name_index.py --- Phonetic name lookup and duplicate-certificate detection.
+Version: 1.0.2
+
+Names are normalized (case, punctuation, titles) and reduced to Soundex codes.
+Each record gets a few blocking keys built from those codes; query_engine.py keeps
+them in its index as by_name. Lookups and duplicate detection only compare records
+that share a block, so finding near-duplicate or re-issued certificates grows
+roughly linearly with the corpus instead of comparing every pair.
+
+Examples:
+    python name_index.py --lookup "Patrick Murphy"
+    python name_index.py --duplicates --threshold 0.85 --output ./data/duplicates.json
+"""
+
+import re
+import json
+import argparse
+import difflib
+
+# Words that are not part of the name itself
+NAME_STOPWORDS = {
+    "mr", "mrs", "miss", "ms", "dr", "rev", "master", "infant", "child", "of", "the",
+    "unknown", "jr", "sr", "widow", "wid"
+}
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6"
+}
+MAX_BLOCK_SIZE = 200   # larger blocks are compared with a sliding window instead of all pairs
+WINDOW_SIZE = 20
+DEFAULT_THRESHOLD = 0.85
+
+def normalize_name(name):
+    """
+    Lowercase name tokens without punctuation or titles: "Mrs. Mary O'Brien" -> ["mary", "obrien"].
+    "Surname, Given" is reordered to given name first: "Smith, John" -> ["john", "smith"].
+    """
+    name = name or ""
+    if "," in name:
+        surname, given = name.split(",", 1)
+        name = f"{given} {surname}"
+    text = re.sub(r"[^\w\s-]", "", name.lower()).replace("-", " ")
+    return [token for token in text.split() if token not in NAME_STOPWORDS and not token.isdigit()]
+
+def soundex(word):
+    """
+    American Soundex code of a word, e.g. "Robert" -> "R163".
+    """
+    letters = [ch for ch in word.lower() if ch.isalpha()]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for ch in letters[1:]:
+        digit = SOUNDEX_CODES.get(ch, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # "h" and "w" do not separate letters with the same code; vowels do.
+        if ch not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+def name_keys(name):
+    """
+    Blocking keys for a name. Each key leaves out one of the two first letters,
+    so a misread first letter of either the given name or the surname still
+    leaves the records sharing a block:
+      S:<surname soundex>:<given initial>
+      G:<given soundex>:<surname soundex without its first letter>
+      S:<surname soundex>:<given soundex without its first letter>
+    """
+    tokens = normalize_name(name)
+    if not tokens:
+        return []
+    surname, given = tokens[-1], tokens[0]
+    surname_code = soundex(surname)
+    if len(tokens) == 1:
+        return [f"S:{surname_code}:"]
+    given_code = soundex(given)
+    return [f"S:{surname_code}:{given[0]}", f"G:{given_code}:{surname_code[1:]}",
+            f"S:{surname_code}:{given_code[1:]}"]
+
+def name_similarity(a, b):
+    return difflib.SequenceMatcher(None, " ".join(normalize_name(a)), " ".join(normalize_name(b))).ratio()
+
+def lookup(index, name, threshold=0.7):
+    """
+    Returns [(filename, person_name, similarity)] for records in index whose names
+    sound like name, best matches first.
+    """
+    candidates = set()
+    for key in name_keys(name):
+        candidates.update(index.by_name.get(key, []))
+    matches = []
+    for filename in candidates:
+        person_name = index.names.get(filename, "")
+        score = name_similarity(name, person_name)
+        if score >= threshold:
+            matches.append((filename, person_name, score))
+    return sorted(matches, key=lambda match: match[2], reverse=True)
+
+def _block_pairs(members, sort_keys):
+    """
+    All pairs of a block, or for blocks over MAX_BLOCK_SIZE the pairs within
+    WINDOW_SIZE of each other in each of the orders given by sort_keys.
+    """
+    if len(members) <= MAX_BLOCK_SIZE:
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                yield members[i], members[j]
+        return
+    # Sorted-neighbourhood: only compare records that sort close to each other.
+    # Common names fill whole blocks with ties, so the death date and location
+    # break them and bring re-issued certificates next to each other.
+    for sort_key in sort_keys:
+        ordered = sorted(members, key=sort_key)
+        for i in range(len(ordered)):
+            for j in range(i + 1, min(i + WINDOW_SIZE, len(ordered))):
+                yield ordered[i], ordered[j]
+
+def find_duplicates(index, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns candidate duplicate pairs as dicts with the two filenames and names, the
+    name similarity and whether the death date / location also agree. A matching
+    date or location adds to the score, so re-issued certificates rank first.
+    """
+    dates = index.value_map("date")
+    locations = index.value_map("death_location")
+    names = {}
+
+    def name_of(filename):
+        if filename not in names:
+            names[filename] = " ".join(normalize_name(index.names.get(filename, "")))
+        return names[filename]
+
+    sort_keys = [
+        lambda filename: (name_of(filename), dates.get(filename) or "", locations.get(filename) or ""),
+        lambda filename: (name_of(filename), locations.get(filename) or "", dates.get(filename) or ""),
+    ]
+    seen = set()
+    duplicates = []
+    for members in index.by_name.values():
+        if len(members) < 2:
+            continue
+        for a, b in _block_pairs(members, sort_keys):
+            pair = (a, b) if a < b else (b, a)
+            if pair in seen:
+                continue
+            seen.add(pair)
+            similarity = name_similarity(index.names.get(a, ""), index.names.get(b, ""))
+            if similarity < threshold:
+                continue
+            same_date = bool(dates.get(a)) and dates.get(a) == dates.get(b)
+            same_location = bool(locations.get(a)) and locations.get(a) == locations.get(b)
+            duplicates.append({
+                "filenames": list(pair),
+                "person_names": [index.names.get(pair[0], ""), index.names.get(pair[1], "")],
+                "name_similarity": round(similarity, 3),
+                "same_death_date": same_date,
+                "same_death_location": same_location,
+                "score": round(similarity + 0.5 * same_date + 0.5 * same_location, 3)
+            })
+    return sorted(duplicates, key=lambda dup: dup["score"], reverse=True)
+
+def main():
+    from query_engine import RecordIndex
+
+    parser = argparse.ArgumentParser(description="Look up records by name or find duplicate certificates.")
+    parser.add_argument("--lookup", metavar="NAME", help="Print records whose person_name sounds like NAME.")
+    parser.add_argument("--duplicates", action="store_true", help="Find likely duplicate certificates.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Minimum name similarity for duplicates (default: {DEFAULT_THRESHOLD}).")
+    parser.add_argument("--output", help="With --duplicates, write the pairs to this JSON file.")
+    args = parser.parse_args()
+    if not args.lookup and not args.duplicates:
+        parser.error("nothing to do; pass --lookup NAME and/or --duplicates")
+
+    index = RecordIndex.load()
+    if args.lookup:
+        for filename, person_name, score in lookup(index, args.lookup):
+            print(f"{filename}\t{person_name}\t{score:.2f}")
+    if args.duplicates:
+        duplicates = find_duplicates(index, args.threshold)
+        print(f"{len(duplicates)} candidate duplicate pairs")
+        for dup in duplicates[:20]:
+            print(f"{dup['score']:.2f}\t{dup['filenames'][0]} {dup['person_names'][0]!r}\t"
+                  f"{dup['filenames'][1]} {dup['person_names'][1]!r}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(duplicates, f, indent=2)
+            print(f"Duplicate pairs saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
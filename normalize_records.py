@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+normalize_records.py --- Normalizes LLM-extracted death dates and locations.
+Version: 1.0.2
+
+Runs after deepseek_request.py. Reads ./deepseek/deepseek_response.json, parses each
+death_date into ISO form and reduces each death_location to a canonical key plus
+ward number, saves the results to ./deepseek/normalized_response.json and merges
+them into the global file as the death_date_iso, death_location_key and death_ward
+columns that query_engine.py indexes.
+
+Locations repeat heavily across certificates, so both parsers are memoized.
+"""
+
+import re
+from datetime import datetime
+from functools import lru_cache
+from global_updater import update_global_file
+from record_io import StageOutput, iter_records, stage_path
+
+DATE_FORMATS = ["%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y", "%d %B %Y", "%Y-%m-%d", "%m/%d/%Y"]
+
+# Abbreviations seen in addresses -> canonical word
+STREET_WORDS = {
+    "st": "street", "str": "street", "ave": "avenue", "av": "avenue", "pl": "place",
+    "sq": "square", "rd": "road", "ln": "lane", "hosp": "hospital",
+}
+# Only expanded in front of a street name ("E. 14th St."), never on their own
+DIRECTION_WORDS = {"e": "east", "w": "west", "n": "north", "s": "south"}
+# Words after which "st" starts a name ("corner of St. Mark's Place") rather than ending one
+NOT_STREET_NAMES = {"and", "of", "at", "near", "cor", "corner", "to", "from", "in", "on"}
+ORDINAL_WORDS = {
+    "first": "1", "second": "2", "third": "3", "fourth": "4", "fifth": "5", "sixth": "6",
+    "seventh": "7", "eighth": "8", "ninth": "9", "tenth": "10", "eleventh": "11", "twelfth": "12",
+}
+# Trailing city names that add nothing to the key
+CITY_SUFFIX = re.compile(r",?\s*(new york( city)?|n\.?\s?y\.?( city)?|nyc|manhattan)\s*\.?$", re.IGNORECASE)
+WARD_NUMBER = r"(\d{1,2}|" + "|".join(ORDINAL_WORDS) + r")"
+WARD_PATTERN = re.compile(
+    r"\b" + WARD_NUMBER + r"(?:st|nd|rd|th)?\s+ward\b|\bward\s+(?:no\.?\s*)?" + WARD_NUMBER + r"\b",
+    re.IGNORECASE
+)
+
+@lru_cache(maxsize=None)
+def normalize_date(text):
+    """
+    Parses a free-form death_date ("Month Day, Year" and a few variants) and returns
+    it as an ISO date string, or "" if it is not a date.
+    """
+    if not text:
+        return ""
+    cleaned = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", text.strip().rstrip("."))
+    # Abbreviated months: "Jul. 4" -> "Jul 4", "Sept 3" -> "Sep 3"
+    cleaned = re.sub(r"\b([A-Za-z]{3,4})\.", r"\1", cleaned)
+    cleaned = re.sub(r"\bsept\b", "Sep", cleaned, flags=re.IGNORECASE)
+    cleaned = re.sub(r"\s+", " ", cleaned)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(cleaned, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+@lru_cache(maxsize=None)
+def normalize_location(text):
+    """
+    Returns (location_key, ward) for a free-form death_location. The key is the
+    lowercased address with abbreviations expanded and the ward and city removed,
+    e.g. "No. 29 Elizabeth St., 6th Ward, N.Y." -> ("29 elizabeth street", 6).
+    ward is None when the location does not name one.
+    """
+    if not text:
+        return "", None
+    ward = None
+    match = WARD_PATTERN.search(text)
+    if match:
+        number = (match.group(1) or match.group(2)).lower()
+        ward = int(ORDINAL_WORDS.get(number, number))
+        text = text[:match.start()] + text[match.end():]
+    text = CITY_SUFFIX.sub("", text.strip())
+    text = re.sub(r"\bno\.?\s*(?=\d)", "", text, flags=re.IGNORECASE)
+    # Possessives ("St. Vincent's", "Ward's Island") would leave a stray "s".
+    text = re.sub(r"(\w)['’]s\b", r"\1", text)
+    words = re.sub(r"[^\w\s]", " ", text.lower()).split()
+    words = [re.sub(r"^(\d+)(st|nd|rd|th)$", r"\1", word) for word in words]
+    return " ".join(expand_word(words, i) for i in range(len(words))), ward
+
+def expand_word(words, i):
+    """
+    Canonical form of words[i] given its neighbours: "st" is "street" after a
+    street name and "saint" otherwise; n/s/e/w are directions only in front of a
+    street name.
+    """
+    word = words[i]
+    if word in ORDINAL_WORDS:
+        return ORDINAL_WORDS[word]
+    if word == "st":
+        return "street" if i > 0 and words[i - 1] not in NOT_STREET_NAMES else "saint"
+    if word in DIRECTION_WORDS:
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if following and following not in STREET_WORDS and following not in NOT_STREET_NAMES:
+            return DIRECTION_WORDS[word]
+        return word
+    return STREET_WORDS.get(word, word)
+
+def normalize_record(record):
+    location_key, ward = normalize_location(record.get("death_location", ""))
+    return {
+        "filename": record.get("filename"),
+        "death_date_iso": normalize_date(record.get("death_date", "")),
+        "death_location_key": location_key,
+        "death_ward": ward
+    }
+
+def main():
+    input_file = stage_path("./deepseek/deepseek_response.json")
+    output_file = stage_path("./deepseek/normalized_response.json")
+
+    normalized = StageOutput(output_file)
+    processed_files = {entry.get("filename") for entry in normalized if "filename" in entry}
+
+    new_entries = []
+    for record in iter_records(input_file):
+        filename = record.get("filename")
+        if not filename or filename in processed_files:
+            continue
+        new_entries.append(normalize_record(record))
+        processed_files.add(filename)
+
+    if not new_entries:
+        print("No new records to normalize.")
+        return
+
+    # Normalizing is cheap, so save and merge once for the whole batch.
+    normalized.extend(new_entries)
+    update_global_file(output_file, records=new_entries)
+
+    dates = normalize_date.cache_info()
+    locations = normalize_location.cache_info()
+    print(f"Normalized {len(new_entries)} records "
+          f"(date cache hits {dates.hits}/{dates.hits + dates.misses}, "
+          f"location cache hits {locations.hits}/{locations.hits + locations.misses}).")
+
+if __name__ == "__main__":
+    main()
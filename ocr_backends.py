@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+ocr_backends.py --- Pluggable OCR engines for document_ai_processor.py.
+Version: 1.2.2
+
+Every backend turns the bytes of a PDF into an OCRResult (text, confidence 0..1,
+backend name). Available backends:
+  - documentai  Google Document AI online processing (the original behaviour)
+  - tesseract   local Tesseract OCR over rendered pages, one process per page
+                (needs pytesseract, pdf2image and the tesseract/poppler binaries)
+  - routed      local first; documents whose local confidence is below the
+                threshold are sent to Document AI instead
+Select one with OCR_BACKEND (default: documentai).
+
+With OCR_SPLIT_PAGES=1 any backend is wrapped in PageSplittingBackend: PDFs are
+split into page batches (within Document AI's online request limits), the batches
+are OCR'd in parallel and the text is put back together in page order. Each batch
+result is cached under ./ocr/pages, so a retry only redoes the batches that failed.
+Splitting needs the pypdf package.
+"""
+
+import io
+import os
+import shutil
+import json
+import base64
+import hashlib
+import threading
+import requests
+import retry_policy
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import pytesseract
+    from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+except ImportError:
+    pytesseract = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = None
+
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "documentai")
+OCR_CONFIDENCE_THRESHOLD = float(os.environ.get("OCR_CONFIDENCE_THRESHOLD", "0.80"))
+OCR_SPLIT_PAGES = os.environ.get("OCR_SPLIT_PAGES", "0") == "1"
+
+# Page splitting
+PAGE_BATCH_SIZE = int(os.environ.get("OCR_PAGE_BATCH_SIZE", "1"))  # pages per request
+PAGE_WORKERS = int(os.environ.get("OCR_PAGE_WORKERS", "4"))        # batches OCR'd at once
+PAGE_CACHE_DIR = "./ocr/pages"
+MAX_PAGES_PER_REQUEST = 15                # Document AI online processing page limit
+MAX_BYTES_PER_REQUEST = 20 * 1024 * 1024  # stay well under the online request size limit
+
+OCRResult = namedtuple("OCRResult", ["text", "confidence", "backend"])
+
+# Plugin registry for OCR backends
+OCR_BACKENDS = {}
+
+
+def register_backend(name):
+    """
+    Decorator to register an OCR backend.
+    """
+    def decorator(cls):
+        cls.name = name
+        OCR_BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+class BaseOCRBackend:
+    """
+    BaseOCRBackend defines the interface for all OCR backends.
+    """
+    name = "base"
+    last_error = None  # why the last process_document call returned None
+
+    def process_document(self, pdf_bytes):
+        """
+        Returns an OCRResult for the PDF, or None if it could not be processed.
+        """
+        raise NotImplementedError("process_document must be implemented by subclasses.")
+
+    def process_file(self, file_path):
+        with open(file_path, "rb") as f:
+            return self.process_document(f.read())
+
+    def close(self):
+        pass
+
+    def summary(self):
+        return ""
+
+
+def post_document(pdf_bytes, access_token, endpoint_url, label="document"):
+    """
+    Sends a PDF to a Document AI :process endpoint, with retry_policy's timeouts
+    and retries. Returns the response JSON, or None on a non-200 response.
+    Raises requests.exceptions.RequestException if the endpoint cannot be reached.
+    """
+    payload = {
+        "rawDocument": {
+            "content": base64.b64encode(pdf_bytes).decode("utf-8"),
+            "mimeType": "application/pdf"
+        }
+    }
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    response = retry_policy.request("post", endpoint_url, label=f"Document AI {label}", headers=headers, json=payload)
+    if response.status_code != 200:
+        print(f"Error processing {label}: {response.status_code} - {response.text}")
+        return None
+    return response.json()
+
+
+def document_confidence(document):
+    """
+    Mean page layout confidence of a Document AI document (1.0 if none is reported).
+    """
+    scores = [page.get("layout", {}).get("confidence") for page in document.get("pages", [])]
+    scores = [score for score in scores if score is not None]
+    return sum(scores) / len(scores) if scores else 1.0
+
+
+@register_backend("documentai")
+class DocumentAIBackend(BaseOCRBackend):
+    """
+    Remote OCR through the Document AI online :process endpoint.
+    token_provider is called for every request, so it can hand out refreshed tokens.
+    """
+    def __init__(self, endpoint_url, token_provider, **_):
+        self.endpoint_url = endpoint_url
+        self.token_provider = token_provider
+
+    def process_document(self, pdf_bytes):
+        try:
+            response_data = post_document(pdf_bytes, self.token_provider(), self.endpoint_url)
+        except requests.exceptions.RequestException as e:
+            print(f"Error processing document: {e}")
+            self.last_error = f"{type(e).__name__}: {e}"
+            return None
+        if response_data is None:
+            self.last_error = "Document AI returned an error response"
+            return None
+        document = response_data.get("document", {})
+        return OCRResult(document.get("text", ""), document_confidence(document), self.name)
+
+
+def _tesseract_page(args):
+    """
+    Renders one page and OCRs it. Runs in a worker process.
+    Returns (text, [word confidences 0..100]).
+    """
+    pdf_bytes, page_number, dpi, lang = args
+    image = convert_from_bytes(pdf_bytes, dpi=dpi, first_page=page_number, last_page=page_number)[0]
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    # Rebuild the text from the word boxes so each page is only OCR'd once.
+    lines, confidences = {}, []
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line, []).append(word)
+        if float(data["conf"][i]) >= 0:
+            confidences.append(float(data["conf"][i]))
+    text = "".join(" ".join(words) + "\n" for _, words in sorted(lines.items()))
+    return text, confidences
+
+
+@register_backend("tesseract")
+class TesseractBackend(BaseOCRBackend):
+    """
+    Local OCR: renders each page with poppler and runs Tesseract on it, with the
+    pages of a document spread over a process pool.
+    """
+    def __init__(self, dpi=300, lang="eng", workers=None, **_):
+        if pytesseract is None:
+            raise RuntimeError("The tesseract backend needs the 'pytesseract' and 'pdf2image' packages.")
+        self.dpi = dpi
+        self.lang = lang
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+
+    def process_document(self, pdf_bytes):
+        try:
+            page_count = pdfinfo_from_bytes(pdf_bytes)["Pages"]
+            jobs = [(pdf_bytes, page, self.dpi, self.lang) for page in range(1, page_count + 1)]
+            if page_count == 1:
+                pages = [_tesseract_page(jobs[0])]
+            else:
+                # One pool for the whole run; worker start-up costs more than a page.
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                pages = list(self.pool.map(_tesseract_page, jobs))
+        except Exception as e:
+            print(f"Local OCR failed: {e}")
+            self.last_error = f"Local OCR failed: {e}"
+            return None
+        confidences = [conf for _, page_confidences in pages for conf in page_confidences]
+        confidence = sum(confidences) / len(confidences) / 100 if confidences else 0.0
+        return OCRResult("".join(text for text, _ in pages), confidence, self.name)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+@register_backend("routed")
+class RoutingBackend(BaseOCRBackend):
+    """
+    Tries the local backend first and falls back to the remote one when the local
+    result is missing or its confidence is below the threshold.
+    """
+    def __init__(self, endpoint_url, token_provider, threshold=OCR_CONFIDENCE_THRESHOLD, **options):
+        self.local = TesseractBackend(**options)
+        self.remote = DocumentAIBackend(endpoint_url, token_provider)
+        self.threshold = threshold
+        self.local_count = 0
+        self.remote_count = 0
+        self.lock = threading.Lock()
+
+    def process_document(self, pdf_bytes):
+        result = self.local.process_document(pdf_bytes)
+        if result is not None and result.confidence >= self.threshold:
+            with self.lock:
+                self.local_count += 1
+            return result
+        with self.lock:
+            self.remote_count += 1
+        remote_result = self.remote.process_document(pdf_bytes)
+        if remote_result is None and result is None:
+            self.last_error = self.remote.last_error
+        return remote_result or result
+
+    def close(self):
+        self.local.close()
+
+    def summary(self):
+        total = self.local_count + self.remote_count
+        if not total:
+            return "routed OCR: no documents processed"
+        return (f"routed OCR: {self.local_count}/{total} local, {self.remote_count}/{total} sent to "
+                f"Document AI (threshold {self.threshold:.2f})")
+
+
+def render_pages(reader, first_page, last_page):
+    """
+    Serializes pages first_page..last_page (1-based, inclusive) of reader as a PDF.
+    """
+    writer = PdfWriter()
+    for number in range(first_page, last_page + 1):
+        writer.add_page(reader.pages[number - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def split_pdf(pdf_bytes, pages_per_batch=PAGE_BATCH_SIZE, is_cached=None):
+    """
+    Splits a PDF into batches of consecutive pages. Returns a list of
+    (first_page, last_page, batch_pdf_bytes), 1-based and inclusive. Each batch is
+    rendered once; one over the Document AI size limit is halved until it fits
+    (a single page is sent as it is). Batches for which is_cached(first, last)
+    is true are not rendered and come back with None as their bytes.
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    pages_per_batch = max(1, min(pages_per_batch, MAX_PAGES_PER_REQUEST))
+    batches = []
+
+    def add(first, last):
+        if is_cached is not None and is_cached(first, last):
+            batches.append((first, last, None))
+            return
+        batch_bytes = render_pages(reader, first, last)
+        if len(batch_bytes) > MAX_BYTES_PER_REQUEST and last > first:
+            middle = (first + last) // 2
+            add(first, middle)
+            add(middle + 1, last)
+        else:
+            batches.append((first, last, batch_bytes))
+
+    page_count = len(reader.pages)
+    for first in range(1, page_count + 1, pages_per_batch):
+        add(first, min(first + pages_per_batch - 1, page_count))
+    return batches
+
+
+class PageSplittingBackend(BaseOCRBackend):
+    """
+    Wraps another backend: splits each PDF into page batches, OCRs them in
+    parallel and reassembles the text in page order. Batch results are cached by
+    document hash and page range, so reprocessing a document after a partial
+    failure only sends the batches that are not cached yet. The cache of a
+    document is removed once all of its batches succeeded.
+    """
+    def __init__(self, inner, pages_per_batch=PAGE_BATCH_SIZE, workers=PAGE_WORKERS, cache_dir=PAGE_CACHE_DIR):
+        if PdfReader is None:
+            raise RuntimeError("Page splitting needs the 'pypdf' package.")
+        self.inner = inner
+        self.name = inner.name
+        self.pages_per_batch = pages_per_batch
+        self.workers = workers
+        self.cache_dir = cache_dir
+
+    def cache_path(self, document_key, first_page, last_page):
+        return os.path.join(self.cache_dir, document_key, f"{self.inner.name}-{first_page:04d}-{last_page:04d}.json")
+
+    def process_batch(self, document_key, first_page, last_page, batch_bytes, pdf_bytes):
+        path = self.cache_path(document_key, first_page, last_page)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return OCRResult(**json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Ignoring unreadable page cache {path}: {e}")
+        if batch_bytes is None:
+            # split_pdf skipped rendering a batch whose cache turned out unusable.
+            batch_bytes = render_pages(PdfReader(io.BytesIO(pdf_bytes)), first_page, last_page)
+        result = self.inner.process_document(batch_bytes)
+        if result is None:
+            print(f"OCR failed for pages {first_page}-{last_page}; they will be retried on the next run.")
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result._asdict(), f)
+        os.replace(tmp_path, path)
+        return result
+
+    def process_whole(self, pdf_bytes):
+        result = self.inner.process_document(pdf_bytes)
+        self.last_error = self.inner.last_error if result is None else None
+        return result
+
+    def process_document(self, pdf_bytes):
+        document_key = hashlib.sha256(pdf_bytes).hexdigest()
+        try:
+            # Page ranges already in the cache are not rendered again.
+            batches = split_pdf(pdf_bytes, self.pages_per_batch,
+                                is_cached=lambda first, last: os.path.exists(self.cache_path(document_key, first, last)))
+        except Exception as e:
+            print(f"Could not split PDF ({e}); processing it whole.")
+            return self.process_whole(pdf_bytes)
+        if len(batches) <= 1:
+            return self.process_whole(pdf_bytes)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda batch: self.process_batch(document_key, *batch, pdf_bytes), batches))
+        failed = [f"{first}-{last}" for (first, last, _), result in zip(batches, results) if result is None]
+        if failed:
+            self.last_error = f"pages {', '.join(failed)} failed: {self.inner.last_error}"
+            return None
+        # The document is complete; its text lives in the stage output from here on.
+        shutil.rmtree(os.path.join(self.cache_dir, document_key), ignore_errors=True)
+
+        texts = [result.text if result.text.endswith("\n") or not result.text else result.text + "\n"
+                 for result in results]
+        weights = [last - first + 1 for first, last, _ in batches]
+        confidence = sum(result.confidence * weight for result, weight in zip(results, weights)) / sum(weights)
+        backends = sorted({result.backend for result in results})
+        return OCRResult("".join(texts), confidence, "+".join(backends))
+
+    def close(self):
+        self.inner.close()
+
+    def summary(self):
+        return self.inner.summary()
+
+
+def get_backend(name=OCR_BACKEND, split_pages=OCR_SPLIT_PAGES, **options):
+    """
+    Instantiates a registered backend, wrapped in PageSplittingBackend if
+    split_pages is set. Backends ignore options they do not use, so callers can
+    always pass endpoint_url and token_provider.
+    """
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend '{name}'. Choose from: {', '.join(OCR_BACKENDS)}")
+    backend = OCR_BACKENDS[name](**options)
+    if split_pages:
+        backend = PageSplittingBackend(backend)
+    return backend
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+ollama_client.py --- Shared Ollama /api/generate client for the Deepseek stages.
+Version: 1.2.1
+
+deepseek-r1 writes its reasoning before the answer, and with a JSON schema in
+"format" the model often keeps emitting whitespace after the object is closed.
+By default requests are streamed: tokens are read as they arrive, reasoning
+(<think>...</think>) is skipped, the answer is parsed incrementally and the
+connection is closed as soon as a complete JSON value matching the schema has
+been read, which makes Ollama stop generating. Reasoning is also switched off
+in the request ("think": false) for Ollama versions that support it.
+
+TieredDispatcher sends each prompt to a small, fast model first and escalates to
+the large model only when the answer fails the stage's validation (or the small
+model errors). A model Ollama reports as not installed is skipped from then on.
+generate_batch does the same for a prompt covering several records, escalating
+only the records whose answers fail; escalation rates count records.
+
+Configuration:
+    OLLAMA_URL           generate endpoint (default: http://127.0.0.1:11434/api/generate)
+    OLLAMA_MODEL         large model, the last tier (default: deepseek-r1:32b)
+    OLLAMA_SMALL_MODEL   first-tier model; empty to send everything to OLLAMA_MODEL (default: qwen2.5:7b)
+    OLLAMA_STREAM        1 to stream with early termination, 0 to wait for the full response (default: 1)
+    OLLAMA_THINK         1 to let the model reason before answering (default: 0)
+    OLLAMA_NUM_PREDICT   maximum tokens generated per request (default: 2048)
+    OLLAMA_TIMEOUT       maximum seconds per request (default: 600)
+
+Connection errors, read timeouts and 429/5xx answers are retried as configured in
+retry_policy.py; OLLAMA_TIMEOUT bounds a single attempt.
+
+Time to first token, total time and early stops are collected in `stats`;
+per-tier latency and escalation rates in each TieredDispatcher.
+"""
+
+import os
+import json
+import time
+import requests
+import retry_policy
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434/api/generate")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "deepseek-r1:32b")
+OLLAMA_SMALL_MODEL = os.environ.get("OLLAMA_SMALL_MODEL", "qwen2.5:7b")
+MODEL_TIERS = list(dict.fromkeys(model for model in (OLLAMA_SMALL_MODEL, OLLAMA_MODEL) if model))
+OLLAMA_STREAM = os.environ.get("OLLAMA_STREAM", "1") == "1"
+OLLAMA_THINK = os.environ.get("OLLAMA_THINK", "0") == "1"
+OLLAMA_NUM_PREDICT = int(os.environ.get("OLLAMA_NUM_PREDICT", "2048"))
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "600"))
+CONNECT_TIMEOUT = retry_policy.CONNECT_TIMEOUT
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+def build_payload(prompt, json_schema, model=OLLAMA_MODEL, stream=OLLAMA_STREAM, num_predict=OLLAMA_NUM_PREDICT):
+    return {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "think": OLLAMA_THINK,
+        "format": json_schema,
+        "options": {"num_predict": num_predict}
+    }
+
+def matches_schema(value, schema):
+    """
+    Checks value against the subset of JSON Schema the stages use: type,
+    properties, required and items.
+    """
+    expected = schema.get("type")
+    if expected == "array":
+        return isinstance(value, list) and all(matches_schema(item, schema.get("items", {})) for item in value)
+    if expected == "object":
+        if not isinstance(value, dict):
+            return False
+        if any(key not in value for key in schema.get("required", [])):
+            return False
+        return all(matches_schema(value[key], sub) for key, sub in schema.get("properties", {}).items() if key in value)
+    if expected == "string":
+        return isinstance(value, str)
+    return True
+
+def _held_back(text, tag):
+    """
+    Length of the longest suffix of text that could be the start of tag.
+    """
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+class AnswerParser:
+    """
+    Consumes generated tokens, drops <think> blocks and finds the first complete
+    top-level JSON value in the remaining answer text.
+    """
+    def __init__(self):
+        self.pending = ""
+        self.in_think = False
+        self.answer = ""
+        self.pos = 0
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, token):
+        """
+        Adds a token. Returns (value, json_text) once a complete JSON value has
+        been read, otherwise None.
+        """
+        self.pending += token
+        while self.pending:
+            if self.in_think:
+                end = self.pending.find(THINK_CLOSE)
+                if end < 0:
+                    self.pending = self.pending[len(self.pending) - _held_back(self.pending, THINK_CLOSE):]
+                    break
+                self.pending = self.pending[end + len(THINK_CLOSE):]
+                self.in_think = False
+            else:
+                begin = self.pending.find(THINK_OPEN)
+                if begin >= 0:
+                    self.answer += self.pending[:begin]
+                    self.pending = self.pending[begin + len(THINK_OPEN):]
+                    self.in_think = True
+                    continue
+                keep = _held_back(self.pending, THINK_OPEN)
+                self.answer += self.pending[:len(self.pending) - keep]
+                self.pending = self.pending[len(self.pending) - keep:]
+                break
+        return self.scan()
+
+    def scan(self):
+        while self.pos < len(self.answer):
+            ch = self.answer[self.pos]
+            self.pos += 1
+            if self.start is None:
+                if ch in "[{":
+                    self.start, self.depth = self.pos - 1, 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "[{":
+                self.depth += 1
+            elif ch in "]}":
+                self.depth -= 1
+                if self.depth == 0:
+                    text = self.answer[self.start:self.pos]
+                    self.start = None
+                    try:
+                        return json.loads(text), text
+                    except json.JSONDecodeError:
+                        continue
+        return None
+
+    def text(self):
+        return self.answer.strip()
+
+class GenerationTimeout(requests.exceptions.RequestException):
+    """
+    A generation ran past OLLAMA_TIMEOUT. Not retried: it would most likely run as long again.
+    """
+
+class GenerationStats:
+    """
+    Per-request timings for a stage run.
+    """
+    def __init__(self):
+        self.requests = []
+
+    def record(self, ttft, total, tokens, early_stop):
+        self.requests.append({"ttft_s": ttft, "total_s": total, "tokens": tokens, "early_stop": early_stop})
+
+    def summary(self):
+        if not self.requests:
+            return ""
+        count = len(self.requests)
+        ttfts = [r["ttft_s"] for r in self.requests if r["ttft_s"] is not None]
+        mean_ttft = f"{sum(ttfts) / len(ttfts):.2f}s" if ttfts else "n/a"
+        mean_total = sum(r["total_s"] for r in self.requests) / count
+        early = sum(r["early_stop"] for r in self.requests)
+        return (f"Ollama: {count} requests, mean time to first token {mean_ttft}, "
+                f"mean total {mean_total:.2f}s, stopped early {early}/{count}")
+
+stats = GenerationStats()
+
+def _result(payload, parser, parsed, done_reason, start, first_token, tokens):
+    total = time.perf_counter() - start
+    ttft = first_token - start if first_token is not None else None
+    stats.record(ttft, total, tokens, done_reason == "early_stop")
+    return {
+        "model": payload.get("model", ""),
+        "response": parsed[1] if parsed else parser.text(),
+        "done": True,
+        "done_reason": done_reason,
+        "ttft_s": ttft,
+        "total_s": total
+    }
+
+def send_generate_request(payload, url=OLLAMA_URL, timeout=OLLAMA_TIMEOUT):
+    """
+    Sends a generate request and returns a dict shaped like Ollama's non-streaming
+    reply, whose "response" holds the answer JSON without the reasoning.
+    Streamed requests (payload["stream"]) stop as soon as the answer is complete.
+    Transient failures are retried; raises requests.exceptions.RequestException
+    on HTTP errors and timeouts that remain.
+    """
+    return retry_policy.call_with_retries(_generate, payload, url, timeout, label=f"Ollama {payload.get('model', '')}")
+
+def _generate(payload, url, timeout):
+    schema = payload.get("format") if isinstance(payload.get("format"), dict) else None
+    parser = AnswerParser()
+    start = time.perf_counter()
+
+    if not payload.get("stream", True):
+        response = requests.post(url, json=payload, timeout=(CONNECT_TIMEOUT, timeout))
+        response.raise_for_status()
+        api_result = response.json()
+        parsed = parser.feed(api_result.get("response", ""))
+        return _result(payload, parser, parsed, api_result.get("done_reason", "stop"), start, None,
+                       api_result.get("eval_count", 0))
+
+    first_token, tokens, parsed, done_reason = None, 0, None, "stop"
+    with requests.post(url, json=payload, stream=True, timeout=(CONNECT_TIMEOUT, timeout)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None):
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise requests.exceptions.RequestException(f"Ollama error: {chunk['error']}")
+            token = chunk.get("response", "")
+            if first_token is None and (token or chunk.get("thinking")):
+                first_token = time.perf_counter()
+            tokens += 1
+            found = parser.feed(token) if token else None
+            if found is not None and (schema is None or matches_schema(found[0], schema)):
+                parsed = found
+                # Closing the connection cancels the rest of the generation.
+                done_reason = "stop" if chunk.get("done") else "early_stop"
+                break
+            if chunk.get("done"):
+                done_reason = chunk.get("done_reason", "stop")
+                break
+            if time.perf_counter() - start > timeout:
+                raise GenerationTimeout(f"Generation exceeded {timeout:.0f}s")
+    return _result(payload, parser, parsed, done_reason, start, first_token, tokens)
+
+def parse_json_response(api_result):
+    try:
+        return json.loads(api_result.get("response", "").strip())
+    except json.JSONDecodeError:
+        return None
+
+class TieredDispatcher:
+    """
+    Tries the models in order (smallest first) until an answer passes validation.
+    The last tier's answer is returned whether or not it validates.
+    """
+    def __init__(self, url=OLLAMA_URL, models=None):
+        self.url = url
+        self.models = list(models or MODEL_TIERS)
+        self.unavailable = set()
+        self.tiers = {model: {"requests": 0, "records": 0, "accepted": 0, "escalated": 0, "errors": 0,
+                              "seconds": 0.0} for model in self.models}
+
+    def available(self, models=None):
+        return [model for model in (models or self.models) if model not in self.unavailable]
+
+    def send(self, model, prompt, json_schema, records, last):
+        """
+        Sends prompt to one tier and returns the API result, or None if the
+        request failed and a later tier can take over. Errors on the last tier are raised.
+        """
+        tier = self.tiers[model]
+        tier["requests"] += 1
+        tier["records"] += records
+        start = time.perf_counter()
+        try:
+            return send_generate_request(build_payload(prompt, json_schema, model=model), self.url)
+        except requests.exceptions.RequestException as e:
+            tier["errors"] += 1
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code == 404 and not last:
+                print(f"Model {model} is not available; using the next tier from now on.")
+                self.unavailable.add(model)
+            if last:
+                raise
+            tier["escalated"] += records
+            return None
+        finally:
+            tier["seconds"] += time.perf_counter() - start
+
+    def generate(self, prompt, json_schema, validate, parse=parse_json_response, models=None):
+        """
+        Returns (parsed answer, model that produced it). validate receives the
+        parsed answer; parse turns the API result into it. models restricts the
+        tiers tried (e.g. to the last one). Errors from the last tier are raised.
+        """
+        models = self.available(models)
+        for i, model in enumerate(models):
+            last = i == len(models) - 1
+            api_result = self.send(model, prompt, json_schema, 1, last)
+            if api_result is None:
+                continue
+            parsed = parse(api_result)
+            if last or validate(parsed):
+                self.tiers[model]["accepted"] += 1
+                return parsed, model
+            self.tiers[model]["escalated"] += 1
+        raise requests.exceptions.RequestException("No model tier is available")
+
+    def generate_batch(self, keys, build_prompt, json_schema, split, validate, parse=parse_json_response):
+        """
+        Batched generate. build_prompt(keys) makes one prompt for several records;
+        split(parsed, keys) maps the parsed answer to {key: answer}. Answers that
+        pass validate are kept, and only the records without one are sent to the
+        next tier in a smaller prompt; the last tier's answers are kept whether or
+        not they validate. Returns {key: answer}; missing keys got no answer,
+        e.g. because the last tier's request failed.
+        """
+        answers = {}
+        pending = list(keys)
+        models = self.available()
+        for i, model in enumerate(models):
+            if not pending:
+                break
+            last = i == len(models) - 1
+            try:
+                api_result = self.send(model, build_prompt(pending), json_schema, len(pending), last)
+            except requests.exceptions.RequestException as e:
+                # Keep the answers earlier tiers gave; the rest stay missing.
+                print(f"Batch request for {len(pending)} records failed: {e}")
+                break
+            if api_result is None:
+                continue
+            found = split(parse(api_result), pending)
+            accepted = {key: answer for key, answer in found.items() if last or validate(answer)}
+            answers.update(accepted)
+            pending = [key for key in pending if key not in accepted]
+            self.tiers[model]["accepted"] += len(accepted)
+            if not last:
+                self.tiers[model]["escalated"] += len(pending)
+        return answers
+
+    def summary(self):
+        lines = []
+        for model in self.models:
+            tier = self.tiers[model]
+            if not tier["requests"]:
+                continue
+            line = (f"Tier {model}: {tier['requests']} requests for {tier['records']} records, "
+                    f"mean {tier['seconds'] / tier['requests']:.2f}s, accepted {tier['accepted']}")
+            if model != self.models[-1]:
+                line += (f", escalated {tier['escalated']} records "
+                         f"({100 * tier['escalated'] / tier['records']:.1f}%)")
+            if tier["errors"]:
+                line += f", errors {tier['errors']}"
+            lines.append(line)
+        return "\n".join(lines)
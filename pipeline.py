@@ -2,37 +2,70 @@
 """
 pipeline.py --- Runs the full processing pipeline sequentially by importing modules,
 updates the global complete_data.json, and calls the cholera processing module.
-Version: 1.0.5
+Version: 1.3.1
+
+Use --profile [STAGE ...] to run stages under stage_profiler (all stages when no
+names are given); profiles are written to --profile-dir.
+
+Use --retry-failed to skip the downloader and only re-send the PDFs in the OCR
+stage's dead-letter queue (./data/dead_letters.json). The later stages run
+incrementally as usual, so they retry their own queued failures and pick up the
+records OCR recovered.
 """
 
+import argparse
 import importlib
 import os
+import sys
 import json
 import time
 import traceback
 from global_updater import update_global_file
+from record_io import stage_path
 import cholera_processor  # Import the separate cholera processing module
+import stage_profiler
 
 # File paths for the various outputs
-SAVED_FILES = "./records/saved_files.json"                       # Output from historical_vital_records_downloader.py
-OCR_JSON = "./ocr/transcribed_json.json"                         # Output from document_ai_processor.py
-DEEPOSEEK_NAMES_JSON = "./deepseek/deepseek_names.json"          # Output from deepseek_name_request.py
-DEEPOSEEK_JSON = "./deepseek/deepseek_response.json"             # Output from deepseek_request.py
-DEEPOSEEK_CHOLERA_JSON = "./deepseek/deepseek_yes_no_response.json"  # Output from deepseek_cholera_request.py
+SAVED_FILES = "./records/saved_files.json"                                          # Output from historical_vital_records_downloader.py
+OCR_JSON = stage_path("./ocr/transcribed_json.json")                                # Output from document_ai_processor.py
+DEEPOSEEK_NAMES_JSON = stage_path("./deepseek/deepseek_names.json")                 # Output from deepseek_name_request.py
+DEEPOSEEK_JSON = stage_path("./deepseek/deepseek_response.json")                    # Output from deepseek_request.py
+NORMALIZED_JSON = stage_path("./deepseek/normalized_response.json")                 # Output from normalize_records.py
+DEEPOSEEK_CHOLERA_JSON = stage_path("./deepseek/deepseek_yes_no_response.json")     # Output from deepseek_cholera_request.py
 GLOBAL_FILE = "./data/complete_data.json"
 
+# Stage modules in the order they run
+STAGES = [
+    "historical_vital_records_downloader",
+    "document_ai_processor",
+    "deepseek_name_request",
+    "deepseek_request",
+    "normalize_records",
+    "deepseek_cholera_request",
+    "cholera_processor",
+]
+
 # Ensure the global data directory exists
 os.makedirs(os.path.dirname(GLOBAL_FILE), exist_ok=True)
 
-def run_module(module_name):
+def run_module(module_name, profile_dir=None):
     """
     Imports the given module and calls its main() function.
+    If profile_dir is set, the call is run under stage_profiler.
     """
     print(f"Running {module_name}...")
     try:
         module = importlib.import_module(module_name)
         if hasattr(module, 'main'):
-            module.main()
+            # Stages parse their own command line; don't hand them the pipeline's options.
+            pipeline_argv, sys.argv = sys.argv, [module_name]
+            try:
+                if profile_dir:
+                    stage_profiler.profile_call(module_name, module.main, profile_dir)
+                else:
+                    module.main()
+            finally:
+                sys.argv = pipeline_argv
         else:
             print(f"Module {module_name} does not have a main() function.")
     except Exception as e:
@@ -43,26 +76,71 @@ def run_module(module_name):
     # Small delay to ensure file writes are finished
     time.sleep(1)
 
-def main():
-    # Step 1: Run historical_vital_records_downloader.py
-    run_module("historical_vital_records_downloader")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the full document processing pipeline.")
+    parser.add_argument(
+        "--profile",
+        nargs="*",
+        metavar="STAGE",
+        help=f"Profile the given stages (all stages if none are given). Choices: {', '.join(STAGES)}."
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=stage_profiler.PROFILE_DIR,
+        help=f"Directory for .pstats/.collapsed files (default: {stage_profiler.PROFILE_DIR})."
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Only retry the records in the dead-letter queue (skips the downloader)."
+    )
+    args = parser.parse_args(argv)
+    if args.profile:
+        unknown = [stage for stage in args.profile if stage not in STAGES]
+        if unknown:
+            parser.error(f"unknown stage(s) for --profile: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile is None:
+        profiled = set()
+    else:
+        profiled = set(args.profile or STAGES)
+
+    def profile_dir_for(stage):
+        return args.profile_dir if stage in profiled else None
+
+    if args.retry_failed:
+        # document_ai_processor reads this to restrict itself to its dead-letter entries.
+        os.environ["RETRY_FAILED_ONLY"] = "1"
+    else:
+        # Step 1: Run historical_vital_records_downloader.py
+        run_module("historical_vital_records_downloader", profile_dir_for("historical_vital_records_downloader"))
 
     # Step 2: Run document_ai_processor.py
-    run_module("document_ai_processor")
+    run_module("document_ai_processor", profile_dir_for("document_ai_processor"))
+    os.environ.pop("RETRY_FAILED_ONLY", None)
 
     # Step 2.5: Run deepseek_name_request.py
-    run_module("deepseek_name_request")
+    run_module("deepseek_name_request", profile_dir_for("deepseek_name_request"))
 
     # Step 3: Run deepseek_request.py
-    run_module("deepseek_request")
+    run_module("deepseek_request", profile_dir_for("deepseek_request"))
+
+    # Step 3.5: Run normalize_records.py
+    run_module("normalize_records", profile_dir_for("normalize_records"))
 
     # Step 4: Run deepseek_cholera_request.py
-    run_module("deepseek_cholera_request")
+    run_module("deepseek_cholera_request", profile_dir_for("deepseek_cholera_request"))
 
     print("Pipeline processing complete. Global file updated at:", GLOBAL_FILE)
     
     # Run cholera processing module to copy PDFs and update JSON with cholera death records
-    cholera_processor.process_cholera_deaths()
+    if "cholera_processor" in profiled:
+        stage_profiler.profile_call("cholera_processor", cholera_processor.process_cholera_deaths, args.profile_dir)
+    else:
+        cholera_processor.process_cholera_deaths()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+query_engine.py --- Indexed filter/group-by queries and exports over complete_data.json.
+Version: 1.2.2
+
+Builds indexes over the global records on cholera_death, death_date (parsed to a
+real date), death_location, ward and person_name (phonetic blocking keys, see
+name_index.py), and keeps them in ./data/complete_data.index.json.
+The normalized columns written by normalize_records.py are used when present;
+older records are normalized on the fly while indexing.
+The index is rebuilt only when the global file changes; queries are then answered
+from the index without rescanning the records.
+
+Examples:
+    python query_engine.py --cholera yes --group-by month
+    python query_engine.py --from 1866-06-01 --to 1866-08-31 --location "mulberry" --list
+    python query_engine.py --cholera yes --ward 6 --group-by month
+    python query_engine.py --name "Bridget Kelly" --list
+    python query_engine.py --cholera yes --from 1866-01-01 --to 1866-12-31 \\
+        --export ./exports/cholera_1866.json --pdf-dir ./exports/cholera_1866_pdfs
+"""
+
+import os
+import json
+import bisect
+import argparse
+from normalize_records import normalize_date, normalize_location
+from name_index import name_keys, lookup as lookup_name
+from record_io import iter_records, write_records
+from blob_store import with_ocr_text
+from cholera_processor import link_or_copy
+
+GLOBAL_FILE = "./data/complete_data.json"
+INDEX_FILE = "./data/complete_data.index.json"
+SOURCE_PDF_DIR = "./death_certificates"
+
+INDEX_VERSION = 5
+
+GROUP_KEYS = ["cholera_death", "death_location", "ward", "year", "month", "date"]
+
+def normalized_columns(record):
+    """
+    Returns (death_date_iso, death_location_key, death_ward) for a global record,
+    taking the stored columns when normalize_records.py has run on it.
+    """
+    if "death_location_key" in record:
+        return record.get("death_date_iso", ""), record["death_location_key"], record.get("death_ward")
+    location_key, ward = normalize_location(record.get("death_location", ""))
+    return normalize_date(record.get("death_date", "")), location_key, ward
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+class RecordIndex:
+    """
+    Indexes over the global records:
+      by_cholera   cholera_death value -> filenames
+      by_location  death_location_key -> filenames
+      by_ward      ward number (as a string) -> filenames
+      by_name      name blocking key -> filenames
+      names        filename -> person_name
+      dates        (ISO date, filename) pairs sorted by date, for range queries
+    """
+    def __init__(self, filenames, by_cholera, by_location, by_ward, by_name, names, dates, signature=None):
+        self.filenames = filenames
+        self.by_cholera = by_cholera
+        self.by_location = by_location
+        self.by_ward = by_ward
+        self.by_name = by_name
+        self.names = names
+        self.dates = dates
+        self.date_keys = [iso for iso, _ in dates]
+        self.signature = signature
+        self._lookups = {}
+
+    @classmethod
+    def build(cls, records, signature=None):
+        filenames, by_cholera, by_location, by_ward, by_name, names, dates = [], {}, {}, {}, {}, {}, []
+        for record in records:
+            filename = record.get("filename")
+            if not filename:
+                continue
+            filenames.append(filename)
+            date_iso, location_key, ward = normalized_columns(record)
+            by_cholera.setdefault((record.get("cholera_death") or "").lower(), []).append(filename)
+            by_location.setdefault(location_key, []).append(filename)
+            if ward is not None:
+                # JSON object keys are strings; keep them that way in memory too.
+                by_ward.setdefault(str(ward), []).append(filename)
+            if date_iso:
+                dates.append((date_iso, filename))
+            person_name = record.get("person_name") or ""
+            if person_name:
+                names[filename] = person_name
+                for key in name_keys(person_name):
+                    by_name.setdefault(key, []).append(filename)
+        dates.sort()
+        return cls(filenames, by_cholera, by_location, by_ward, by_name, names, dates, signature)
+
+    def to_json(self):
+        return {
+            "version": INDEX_VERSION,
+            "global": self.signature,
+            "filenames": self.filenames,
+            "by_cholera": self.by_cholera,
+            "by_location": self.by_location,
+            "by_ward": self.by_ward,
+            "by_name": self.by_name,
+            "names": self.names,
+            "dates": self.dates
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["filenames"], data["by_cholera"], data["by_location"], data["by_ward"],
+                   data["by_name"], data["names"], [tuple(pair) for pair in data["dates"]], data.get("global"))
+
+    @classmethod
+    def load(cls, global_file=GLOBAL_FILE, index_file=INDEX_FILE):
+        """
+        Returns the index for global_file, rebuilding and saving it if it is missing or stale.
+        """
+        signature = file_signature(global_file) if os.path.exists(global_file) else None
+        if os.path.exists(index_file):
+            with open(index_file, "r", encoding="utf-8") as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError:
+                    data = {}
+            if data.get("version") == INDEX_VERSION and data.get("global") == signature:
+                return cls.from_json(data)
+
+        print(f"[query_engine] Building index for {global_file}")
+        index = cls.build(iter_records(global_file), signature)
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        tmp_path = index_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index.to_json(), f)
+        os.replace(tmp_path, index_file)
+        return index
+
+    def date_range(self, date_from=None, date_to=None):
+        """
+        Filenames whose death_date falls within [date_from, date_to] (ISO strings, inclusive).
+        """
+        lo = bisect.bisect_left(self.date_keys, date_from) if date_from else 0
+        hi = bisect.bisect_right(self.date_keys, date_to) if date_to else len(self.date_keys)
+        return {filename for _, filename in self.dates[lo:hi]}
+
+    def select(self, cholera_death=None, date_from=None, date_to=None, location=None, ward=None, name=None):
+        """
+        Returns the set of filenames matching every given condition. location matches
+        any indexed location containing it (after the same normalization); name matches
+        names that sound alike (see name_index.lookup).
+        """
+        candidates = []
+        if cholera_death is not None:
+            candidates.append(set(self.by_cholera.get(cholera_death.lower(), [])))
+        if date_from or date_to:
+            candidates.append(self.date_range(date_from, date_to))
+        if ward is not None:
+            candidates.append(set(self.by_ward.get(str(ward), [])))
+        if name:
+            candidates.append({filename for filename, _, _ in lookup_name(self, name)})
+        if location:
+            wanted = normalize_location(location)[0]
+            matches = set()
+            for key, filenames in self.by_location.items():
+                if wanted in key:
+                    matches.update(filenames)
+            candidates.append(matches)
+        if not candidates:
+            return set(self.filenames)
+        candidates.sort(key=len)
+        result = candidates[0]
+        for other in candidates[1:]:
+            result = result & other
+        return result
+
+    def value_map(self, key):
+        """
+        filename -> value map for key, built from the index on first use.
+        """
+        if key not in self._lookups:
+            if key == "date":
+                lookup = {filename: iso for iso, filename in self.dates}
+            else:
+                groups = {"cholera_death": self.by_cholera, "death_location": self.by_location,
+                          "ward": self.by_ward}[key]
+                lookup = {filename: value for value, members in groups.items() for filename in members}
+            self._lookups[key] = lookup
+        return self._lookups[key]
+
+    def group_by(self, key, filenames):
+        """
+        Counts filenames per value of key (one of GROUP_KEYS).
+        """
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Cannot group by {key}; choose from {', '.join(GROUP_KEYS)}")
+        width = {"year": 4, "month": 7, "date": 10}.get(key)
+        lookup = self.value_map("date" if width else key)
+        counts = {}
+        for filename in filenames:
+            value = lookup.get(filename)
+            if width:
+                group = value[:width] if value else "(no date)"
+            else:
+                group = value or "(empty)"
+            counts[group] = counts.get(group, 0) + 1
+        if key == "ward":
+            return dict(sorted(counts.items(), key=lambda item: int(item[0]) if item[0].isdigit() else -1))
+        return dict(sorted(counts.items()))
+
+def export_records(filenames, dest, pdf_dir=None, with_text=False, global_file=GLOBAL_FILE):
+    """
+    Writes the records for filenames to dest (format and compression follow its
+    extension) and, if pdf_dir is given, places their PDFs there.
+    """
+    records = (record for record in iter_records(global_file) if record.get("filename") in filenames)
+    if with_text:
+        records = (with_ocr_text(record) for record in records)
+    write_records(dest, records, indent=4)
+    print(f"Exported {len(filenames)} records to {dest}")
+
+    if pdf_dir:
+        os.makedirs(pdf_dir, exist_ok=True)
+        for filename in sorted(filenames):
+            src_path = os.path.join(SOURCE_PDF_DIR, filename + ".pdf")
+            dst_path = os.path.join(pdf_dir, filename + ".pdf")
+            if not os.path.exists(src_path):
+                print(f"Source PDF not found: {src_path}")
+                continue
+            if not os.path.exists(dst_path):
+                link_or_copy(src_path, dst_path)
+        print(f"PDFs exported to {pdf_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and export records from complete_data.json.")
+    parser.add_argument("--cholera", metavar="VALUE", help="cholera_death value: yes, no or unknown.")
+    parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD", help="Earliest death date (inclusive).")
+    parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD", help="Latest death date (inclusive).")
+    parser.add_argument("--location", help="Text the death location must contain.")
+    parser.add_argument("--ward", type=int, help="Ward number.")
+    parser.add_argument("--name", help="Person name; matches names that sound alike.")
+    parser.add_argument("--group-by", choices=GROUP_KEYS, help="Print counts per group instead of a total.")
+    parser.add_argument("--list", action="store_true", help="Print the matching filenames.")
+    parser.add_argument("--export", metavar="PATH", help="Write matching records to PATH (.json/.jsonl, .gz/.zst).")
+    parser.add_argument("--pdf-dir", help="With --export, also place the matching PDFs in this directory.")
+    parser.add_argument("--with-ocr-text", action="store_true", help="With --export, include full OCR text.")
+    args = parser.parse_args()
+
+    index = RecordIndex.load()
+    matches = index.select(args.cholera, args.date_from, args.date_to, args.location, args.ward, args.name)
+
+    if args.group_by:
+        for group, count in index.group_by(args.group_by, matches).items():
+            print(f"{group}\t{count}")
+    else:
+        print(f"{len(matches)} matching records")
+    if args.list:
+        for filename in sorted(matches):
+            print(filename)
+    if args.export:
+        export_records(matches, args.export, pdf_dir=args.pdf_dir, with_text=args.with_ocr_text)
+
+if __name__ == "__main__":
+    main()
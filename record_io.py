@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+record_io.py --- Readers and writers for the stage output files.
+Version: 1.2.1
+
+Stage outputs come in two formats, chosen by file extension:
+  - .json   legacy format: one JSON array, rewritten in full on every save
+  - .jsonl  JSON Lines: one record per line, appended to on every save
+Set STAGE_FORMAT=jsonl to make the stages read and write JSON Lines. Readers are
+iterators in both formats, so a stage never has to hold a whole file in memory.
+
+Either format can be compressed by adding .gz (gzip) or .zst (zstd, needs the
+zstandard package) to the file name; STAGE_COMPRESSION=gzip|zstd makes the stages
+do so. Compressed files are decompressed as a stream while reading. Appending to
+a compressed JSON Lines file adds one gzip member / zstd frame per record, which
+compresses poorly; run "recompress" afterwards to rewrite it as a single stream.
+If an interrupted append left a cut-off member/frame at the end, the next
+StageOutput rewrites the readable records before appending, since new data
+written after a broken member could not be read back.
+
+Converting between the formats:
+    python record_io.py to-jsonl ./ocr/transcribed_json.json
+    python record_io.py to-array ./ocr/transcribed_json.jsonl
+    python record_io.py recompress ./ocr/transcribed_json.jsonl.gz
+"""
+
+import io
+import os
+import sys
+import gzip
+import json
+import zlib
+import argparse
+import textwrap
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STAGE_FORMAT = os.environ.get("STAGE_FORMAT", "json").lower()  # "json" or "jsonl"
+STAGE_COMPRESSION = os.environ.get("STAGE_COMPRESSION", "").lower()  # "", "gzip" or "zstd"
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+READ_CHUNK_SIZE = 1 << 16
+
+# What a cut-short or corrupted compressed stream raises while reading
+CODEC_ERRORS = (EOFError, OSError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def compression_of(file_path):
+    for name, suffix in COMPRESSION_SUFFIXES.items():
+        if file_path.endswith(suffix):
+            return name
+    return ""
+
+
+def base_path(file_path):
+    """
+    file_path without its compression suffix.
+    """
+    compression = compression_of(file_path)
+    return file_path[:-len(COMPRESSION_SUFFIXES[compression])] if compression else file_path
+
+
+def is_jsonl(file_path):
+    return base_path(file_path).endswith(".jsonl")
+
+
+def stage_path(file_path):
+    """
+    Returns the path a stage should use for file_path under the configured
+    STAGE_FORMAT and STAGE_COMPRESSION.
+    """
+    if STAGE_FORMAT == "jsonl" and file_path.endswith(".json"):
+        file_path += "l"
+    if STAGE_COMPRESSION:
+        if STAGE_COMPRESSION not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown STAGE_COMPRESSION: {STAGE_COMPRESSION}")
+        file_path += COMPRESSION_SUFFIXES[STAGE_COMPRESSION]
+    return file_path
+
+
+def open_text(file_path, mode="r"):
+    """
+    Opens file_path as UTF-8 text ("r", "w" or "a"), compressing or decompressing
+    on the fly according to its suffix.
+    """
+    compression = compression_of(file_path)
+    if compression == "gzip":
+        return gzip.open(file_path, mode + "t", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"{file_path}: zstd compression needs the 'zstandard' package.")
+        raw = open(file_path, mode + "b")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(file_path, mode, encoding="utf-8")
+
+
+def ensure_directory_exists(file_path):
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+
+def _iter_jsonl(f, file_path):
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            # Most likely a line cut short by an interrupted append; keep going.
+            print(f"[record_io] Skipping bad line {line_number} in {file_path}: {e}")
+
+
+def _iter_json_array(f):
+    """
+    Yields the elements of a top-level JSON array without loading the whole file.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer:
+        return
+    if not buffer.startswith("["):
+        raise json.JSONDecodeError("Expected a JSON array", buffer, 0)
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        if not buffer and eof:
+            raise json.JSONDecodeError("Unterminated JSON array", buffer, 0)
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+        if len(buffer) < READ_CHUNK_SIZE and not eof:
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+
+
+def iter_records(file_path):
+    """
+    Yields records from a .json array or .jsonl file; yields nothing if the file is missing.
+    Raises json.JSONDecodeError for a malformed .json array.
+    """
+    if not os.path.exists(file_path):
+        return
+    with open_text(file_path, "r") as f:
+        if not is_jsonl(file_path):
+            yield from _iter_json_array(f)
+        elif compression_of(file_path):
+            try:
+                yield from _iter_jsonl(f, file_path)
+            except CODEC_ERRORS as e:
+                # A compressed append that was cut short; everything before it is intact.
+                print(f"[record_io] Stopped at truncated data in {file_path}: {e}")
+        else:
+            yield from _iter_jsonl(f, file_path)
+
+
+def compressed_stream_intact(file_path):
+    """
+    True if every gzip member / zstd frame of file_path decodes and the last one
+    is complete.
+    """
+    compression = compression_of(file_path)
+
+    def decompressor():
+        if compression == "gzip":
+            return zlib.decompressobj(wbits=31)
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    d, pending = decompressor(), False
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                while chunk:
+                    d.decompress(chunk)
+                    pending = True
+                    if not d.eof:
+                        break
+                    # End of one member/frame; the rest of the chunk starts the next.
+                    chunk, d, pending = d.unused_data, decompressor(), False
+    except CODEC_ERRORS:
+        return False
+    return not pending
+
+
+def load_records(file_path):
+    """
+    Returns all records as a list, or [] if the file is missing or malformed.
+    """
+    try:
+        return list(iter_records(file_path))
+    except json.JSONDecodeError:
+        return []
+
+
+def append_record(file_path, record):
+    ensure_directory_exists(file_path)
+    with open_text(file_path, "a") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def write_records(file_path, records, indent=2):
+    """
+    Writes records in the file's format. The write goes to a temporary file that
+    replaces file_path at the end, so readers never see a half-written file.
+    """
+    ensure_directory_exists(file_path)
+    # Keep the compression suffix so open_text() picks the right codec.
+    compression = compression_of(file_path)
+    tmp_path = base_path(file_path) + ".tmp" + (COMPRESSION_SUFFIXES[compression] if compression else "")
+    with open_text(tmp_path, "w") as f:
+        if is_jsonl(file_path):
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            # Streamed equivalent of json.dump(list(records), f, indent=indent).
+            pad = " " * indent
+            first = True
+            f.write("[")
+            for record in records:
+                f.write("\n" if first else ",\n")
+                f.write(textwrap.indent(json.dumps(record, indent=indent), pad))
+                first = False
+            f.write("]" if first else "\n]")
+    os.replace(tmp_path, file_path)
+
+
+class StageOutput:
+    """
+    The output file of a stage. JSON Lines outputs are append-only and never held
+    in memory; legacy .json outputs keep their records in memory and are rewritten
+    on each append, as the stages always did.
+    """
+    def __init__(self, file_path, indent=2):
+        self.path = file_path
+        self.indent = indent
+        self.jsonl = is_jsonl(file_path)
+        self.records = None if self.jsonl else load_records(file_path)
+        if self.jsonl:
+            self._terminate_last_line()
+
+    def _terminate_last_line(self):
+        # An interrupted append can leave a partial last line; start fresh on a new one.
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        if compression_of(self.path):
+            # A cut-off member/frame cannot be patched in place, and anything appended
+            # after it would be unreadable: rewrite the readable records instead.
+            if not compressed_stream_intact(self.path):
+                print(f"[record_io] Rewriting {self.path} without its truncated end")
+                write_records(self.path, iter_records(self.path))
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def __iter__(self):
+        if self.jsonl:
+            return iter_records(self.path)
+        return iter(self.records)
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        if self.jsonl:
+            ensure_directory_exists(self.path)
+            with open_text(self.path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            self.records.extend(records)
+            write_records(self.path, self.records, indent=self.indent)
+
+
+def convert(src, dst, indent=2):
+    """
+    Copies records from src to dst; formats and compression follow the file names.
+    src and dst may be the same file.
+    """
+    write_records(dst, iter_records(src), indent=indent)
+
+
+def default_destination(command, src):
+    compression = compression_of(src)
+    suffix = COMPRESSION_SUFFIXES[compression] if compression else ""
+    stem = os.path.splitext(base_path(src))[0]
+    if command == "to-jsonl":
+        return stem + ".jsonl" + suffix
+    if command == "to-array":
+        return stem + ".json" + suffix
+    return src
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert stage output files between JSON arrays and JSON Lines, or recompress them."
+    )
+    parser.add_argument("command", choices=["to-jsonl", "to-array", "recompress"])
+    parser.add_argument("src", help="Input file.")
+    parser.add_argument("dst", nargs="?",
+                        help="Output file (default: src with the extension swapped; recompress: src itself).")
+    parser.add_argument("--indent", type=int, default=2, help="Indent for JSON array output (default: 2).")
+    args = parser.parse_args()
+
+    dst = args.dst or default_destination(args.command, args.src)
+    if args.command != "recompress" and os.path.abspath(dst) == os.path.abspath(args.src):
+        sys.exit("Source and destination are the same file.")
+    convert(args.src, dst, indent=args.indent)
+    print(f"Converted {args.src} -> {dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+retry_policy.py --- Shared timeouts and retry/backoff for remote calls.
+Version: 1.0.0
+
+Every HTTP call to Document AI, Cloud Storage and Ollama goes through here, so a
+dropped connection, a timeout or a 429/5xx answer is retried with exponential
+backoff (plus jitter, honouring Retry-After) instead of losing the record.
+Errors that will not go away by retrying (4xx other than 408/429) are returned
+or raised right away.
+
+Configuration:
+    REMOTE_CONNECT_TIMEOUT   seconds to establish a connection (default: 10)
+    REMOTE_READ_TIMEOUT      seconds to wait for response data (default: 120)
+    RETRY_ATTEMPTS           attempts per call, including the first (default: 4)
+    RETRY_BACKOFF            first backoff in seconds, doubled per retry (default: 1)
+    RETRY_BACKOFF_MAX        cap on a single backoff in seconds (default: 30)
+"""
+
+import os
+import time
+import random
+import requests
+
+CONNECT_TIMEOUT = float(os.environ.get("REMOTE_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("REMOTE_READ_TIMEOUT", "120"))
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "4"))
+RETRY_BACKOFF = float(os.environ.get("RETRY_BACKOFF", "1"))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "30"))
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.exceptions.HTTPError) and response is not None \
+        and response.status_code in RETRY_STATUSES
+
+def backoff_delay(attempt, response=None):
+    """
+    Seconds to wait before retry number attempt (1-based).
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RETRY_BACKOFF_MAX)
+    delay = min(RETRY_BACKOFF * 2 ** (attempt - 1), RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+def call_with_retries(func, *args, label="request", attempts=None, **kwargs):
+    """
+    Calls func(*args, **kwargs), retrying retryable requests errors with backoff.
+    The last error is raised once the attempts are used up.
+    """
+    attempts = attempts or RETRY_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            if attempt == attempts or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, getattr(e, "response", None))
+            print(f"{label} failed ({type(e).__name__}: {e}); retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+def request(method, url, label="request", attempts=None, **kwargs):
+    """
+    requests.request with the default timeouts and retries. Retryable status codes
+    are retried; the final response is returned whatever its status, so callers
+    keep handling non-2xx answers themselves.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    def send():
+        response = requests.request(method, url, **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            response.raise_for_status()
+        return response
+
+    try:
+        return call_with_retries(send, label=label, attempts=attempts)
+    except requests.exceptions.HTTPError as e:
+        # Out of retries on a retryable status: hand back the response as-is.
+        if e.response is not None and e.response.status_code in RETRY_STATUSES:
+            return e.response
+        raise
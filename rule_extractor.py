@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+rule_extractor.py --- Rule-based extraction of the printed certificate fields.
+Version: 1.0.0
+
+Most certificates use the same printed form ("Name of the deceased (in full):",
+"Date of death:", "Place of death:", "Cause of death:"), so those fields can often
+be read straight from ocr_text. Labels are matched fuzzily to survive OCR errors,
+and each value is checked (a date in 1865-1867, an address with a number, a short
+alphabetic cause, ...) to give a per-field confidence. deepseek_name_request.py
+and deepseek_request.py only send a record to the model when the extractor's
+confidence is below RULE_CONFIDENCE_THRESHOLD.
+
+Set RULE_EXTRACTION=0 to send every record to the model.
+
+Example:
+    python rule_extractor.py ./ocr/transcribed_json.json
+"""
+
+import os
+import re
+import sys
+import difflib
+from datetime import date
+from normalize_records import normalize_date, STREET_WORDS
+from record_io import iter_records
+
+RULE_EXTRACTION = os.environ.get("RULE_EXTRACTION", "1") == "1"
+RULE_CONFIDENCE_THRESHOLD = float(os.environ.get("RULE_CONFIDENCE_THRESHOLD", "0.85"))
+
+# Printed labels for each field, lowercase, as they appear on the forms
+FIELD_LABELS = {
+    "person_name": ["name of the deceased (in full)", "name of deceased", "full name of deceased"],
+    "death_date": ["date of death"],
+    "death_location": ["place of death"],
+    "cause_of_death": ["cause of death"],
+}
+LABEL_THRESHOLD = 0.8
+NEXT_LINE_PENALTY = 0.9  # the value was on the line after its label
+YEAR_RANGE = (1865, 1867)
+LOCATION_WORDS = set(STREET_WORDS.values()) | {"ward", "hospital", "alley", "row", "slip", "court", "island"}
+
+def clean_value(value):
+    return re.sub(r"\s+", " ", value).strip(" :;,.-_\t")
+
+def label_score(line, label):
+    """
+    Similarity of the start of line to label, and where the value begins.
+    Returns (score, value_start).
+    """
+    text = re.sub(r"^\s*\d{1,2}\s*[.)]\s*", "", line)
+    offset = len(line) - len(text)
+    head = text[:len(label)].lower()
+    matcher = difflib.SequenceMatcher(None, head, label)
+    if matcher.real_quick_ratio() < LABEL_THRESHOLD:
+        return 0.0, 0
+    score = matcher.ratio()
+    if score < LABEL_THRESHOLD:
+        return 0.0, 0
+    # OCR may drop or add a character in the label; a nearby colon marks the value.
+    colon = text.find(":", max(0, len(label) - 3), len(label) + 3)
+    start = colon + 1 if colon >= 0 else len(label)
+    return score, offset + start
+
+def find_value(lines, labels):
+    """
+    Returns (value, label confidence) for the line that best matches one of labels.
+    The best match wins rather than the first, since labels such as "date of death"
+    and "place of death" are close enough to pass the fuzzy threshold for each other.
+    """
+    best, best_line, best_start = 0.0, None, 0
+    for i, line in enumerate(lines):
+        score, start = max((label_score(line, label) for label in labels), key=lambda match: match[0])
+        if score > best:
+            best, best_line, best_start = score, i, start
+    if best_line is None:
+        return "", 0.0
+    value = clean_value(lines[best_line][best_start:])
+    if value:
+        return value, best
+    for next_line in lines[best_line + 1:best_line + 3]:
+        if next_line.strip():
+            return clean_value(next_line), best * NEXT_LINE_PENALTY
+    return "", best
+
+def score_name(value):
+    words = value.split()
+    if not words or any(ch.isdigit() for ch in value):
+        return 0.0
+    if not all(re.fullmatch(r"[A-Za-z][A-Za-z.'-]*", word) for word in words):
+        return 0.3
+    return 1.0 if 2 <= len(words) <= 6 else 0.5
+
+def score_date(value):
+    iso = normalize_date(value)
+    if not iso:
+        return 0.0, value
+    parsed = date.fromisoformat(iso)
+    # Same form the model is asked for: Month Day, Year
+    formatted = f"{parsed.strftime('%B')} {parsed.day}, {parsed.year}"
+    return (1.0 if YEAR_RANGE[0] <= parsed.year <= YEAR_RANGE[1] else 0.3), formatted
+
+def score_location(value):
+    words = set(re.sub(r"[^\w\s]", " ", value.lower()).split())
+    if not words:
+        return 0.0
+    has_number = any(word.isdigit() or re.fullmatch(r"\d+(st|nd|rd|th)", word) for word in words)
+    has_place_word = bool(words & LOCATION_WORDS) or bool(words & set(STREET_WORDS))
+    if has_number and has_place_word:
+        return 1.0
+    return 0.7 if has_place_word else 0.5
+
+def score_cause(value):
+    if not value or not re.search(r"[A-Za-z]", value):
+        return 0.0
+    if re.search(r"\d", value) or len(value) > 60 or len(value.split()) > 8:
+        return 0.5
+    return 1.0
+
+def extract_fields(ocr_text, fields):
+    """
+    Returns (values, confidences): the field values read from ocr_text and a
+    0..1 confidence for each.
+    """
+    lines = (ocr_text or "").splitlines()
+    values, confidences = {}, {}
+    for field in fields:
+        value, confidence = find_value(lines, FIELD_LABELS[field])
+        if field == "person_name":
+            confidence *= score_name(value)
+        elif field == "death_date":
+            value_score, value = score_date(value)
+            confidence *= value_score
+        elif field == "death_location":
+            confidence *= score_location(value)
+        elif field == "cause_of_death":
+            confidence *= score_cause(value)
+        values[field] = value
+        confidences[field] = round(confidence, 3)
+    return values, confidences
+
+def extract(record, fields, threshold=RULE_CONFIDENCE_THRESHOLD):
+    """
+    Returns the field values for an OCR record if every field reaches threshold
+    (scaled by the record's ocr_confidence, when present), otherwise None.
+    """
+    if not RULE_EXTRACTION:
+        return None
+    values, confidences = extract_fields(record.get("ocr_text", ""), fields)
+    ocr_confidence = record.get("ocr_confidence")
+    scale = ocr_confidence if isinstance(ocr_confidence, (int, float)) else 1.0
+    if min(confidences.values()) * scale < threshold:
+        return None
+    return values
+
+class ExtractionStats:
+    """
+    Counts how many records were answered by the rules instead of the model.
+    """
+    def __init__(self):
+        self.by_rules = 0
+        self.by_model = 0
+
+    def record(self, by_rules):
+        if by_rules:
+            self.by_rules += 1
+        else:
+            self.by_model += 1
+
+    def summary(self):
+        total = self.by_rules + self.by_model
+        if not total:
+            return ""
+        return (f"Rule extractor: {self.by_rules}/{total} records parsed without the model "
+                f"({100 * self.by_rules / total:.1f}% of LLM calls avoided)")
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python rule_extractor.py OCR_FILE")
+        sys.exit(1)
+    fields = list(FIELD_LABELS)
+    stats = ExtractionStats()
+    for record in iter_records(sys.argv[1]):
+        stats.record(extract(record, fields) is not None)
+    print(stats.summary())
+
+if __name__ == "__main__":
+    main()
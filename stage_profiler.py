@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+stage_profiler.py --- Profiling hooks for pipeline stages.
+Version: 1.0.0
+
+Runs a stage under cProfile while a background thread samples the stage's call
+stack. For every profiled stage two files are written to the profile directory:
+  - <stage>.pstats     deterministic profile, readable with pstats/snakeviz
+  - <stage>.collapsed  sampled stacks in collapsed format ("a;b;c count"),
+                       ready for flamegraph.pl or speedscope
+A short summary of the known hot functions is printed after each stage.
+"""
+
+import os
+import sys
+import time
+import cProfile
+import pstats
+import threading
+from collections import Counter
+
+PROFILE_DIR = "./profiles"
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+# Functions that have shown up as hotspots before; always reported when present.
+HOT_FUNCTIONS = [
+    ("global_updater.py", "merge_records"),
+    ("global_updater.py", "load_json"),
+    ("global_updater.py", "save_json"),
+    ("deepseek_cholera_request.py", "fuzzy_in_text"),
+    ("historical_vital_records_downloader.py", "load_records"),
+]
+
+
+class StackSampler:
+    """
+    Periodically samples the stack of a single thread and counts identical stacks.
+    """
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def hot_function_stats(stats):
+    """
+    Returns (label, calls, tottime, cumtime) for every HOT_FUNCTIONS entry found in stats.
+    """
+    wanted = set(HOT_FUNCTIONS)
+    found = []
+    for (filename, _, funcname), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        key = (os.path.basename(filename), funcname)
+        if key in wanted:
+            label = f"{os.path.splitext(key[0])[0]}.{funcname}"
+            found.append((label, ncalls, tottime, cumtime))
+    return sorted(found, key=lambda item: item[3], reverse=True)
+
+
+def profile_call(stage_name, func, profile_dir=PROFILE_DIR, interval=SAMPLE_INTERVAL):
+    """
+    Runs func() under both profilers and writes <stage_name>.pstats and
+    <stage_name>.collapsed into profile_dir. Returns whatever func returns.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    pstats_path = os.path.join(profile_dir, f"{stage_name}.pstats")
+    collapsed_path = os.path.join(profile_dir, f"{stage_name}.collapsed")
+
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), interval=interval)
+    start = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - start
+
+        profiler.dump_stats(pstats_path)
+        sampler.write_collapsed(collapsed_path)
+
+        stats = pstats.Stats(profiler)
+        print(f"[profile] {stage_name}: {elapsed:.2f}s wall, "
+              f"{sum(sampler.samples.values())} samples -> {pstats_path}, {collapsed_path}")
+        for label, ncalls, tottime, cumtime in hot_function_stats(stats):
+            print(f"[profile]   hot {label}: calls={ncalls} tottime={tottime:.3f}s cumtime={cumtime:.3f}s")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the top entries of a saved stage profile.")
+    parser.add_argument("pstats_file", help="Path to a .pstats file written by profile_call().")
+    parser.add_argument("-n", "--limit", type=int, default=25, help="Number of rows to print.")
+    parser.add_argument("--sort", default="cumulative", help="pstats sort key (default: cumulative).")
+    args = parser.parse_args()
+
+    stats = pstats.Stats(args.pstats_file)
+    stats.sort_stats(args.sort).print_stats(args.limit)
+    for label, ncalls, tottime, cumtime in hot_function_stats(stats):
+        print(f"hot {label}: calls={ncalls} tottime={tottime:.3f}s cumtime={cumtime:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
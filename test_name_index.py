@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+test_name_index.py --- Checks that misread names still share a blocking key.
+Version: 1.0.0
+
+Run with: python -m pytest test_name_index.py
+"""
+
+import pytest
+from name_index import MAX_BLOCK_SIZE, find_duplicates, name_keys, normalize_name
+
+@pytest.mark.parametrize("misread", [
+    "Iohn Smith",    # first letter of the given name
+    "John Bmith",    # first letter of the surname
+    "Jobn Smith",    # a later letter
+    "Smith, John",   # surname written first
+])
+def test_misread_names_share_a_block(misread):
+    assert set(name_keys("John Smith")) & set(name_keys(misread))
+
+def test_surname_first_is_reordered():
+    assert normalize_name("Smith, John") == ["john", "smith"]
+
+def test_duplicate_found_in_oversized_block_of_identical_names():
+    from query_engine import RecordIndex
+    records = [{"filename": f"cert{i:04d}", "person_name": "John Murphy",
+                "death_date_iso": f"1866-{1 + i % 12:02d}-{1 + i % 28:02d}", "death_location_key": f"{i} mott street"}
+               for i in range(MAX_BLOCK_SIZE + 100)]
+    # A re-issued certificate of cert0005, filed far away from it.
+    records.append(dict(records[5], filename="zzz-reissue"))
+    duplicates = find_duplicates(RecordIndex.build(records))
+    pairs = {tuple(dup["filenames"]) for dup in duplicates if dup["same_death_date"] and dup["same_death_location"]}
+    assert ("cert0005", "zzz-reissue") in pairs
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+test_normalize_records.py --- Checks date parsing and location keys on tricky inputs.
+Version: 1.0.0
+
+Run with: python -m pytest test_normalize_records.py
+"""
+
+import pytest
+from normalize_records import normalize_date, normalize_location
+
+@pytest.mark.parametrize("text, key", [
+    ("St. Vincent's Hospital", "saint vincent hospital"),
+    ("Ward's Island", "ward island"),
+    ("Women's Hospital", "women hospital"),
+    ("E. 14th St.", "east 14 street"),
+    ("No. 29 Elizabeth St., 6th Ward, N.Y.", "29 elizabeth street"),
+])
+def test_location_key(text, key):
+    assert normalize_location(text)[0] == key
+
+@pytest.mark.parametrize("text, iso", [
+    ("Jul. 4th, 1866", "1866-07-04"),
+    ("Sept. 3, 1866", "1866-09-03"),
+    ("May 1, 1866", "1866-05-01"),
+])
+def test_date(text, iso):
+    assert normalize_date(text) == iso
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+test_record_io.py --- Checks that compressed JSON Lines outputs survive an interrupted append.
+Version: 1.0.0
+
+Run with: python -m pytest test_record_io.py
+"""
+
+import os
+import pytest
+import record_io
+from record_io import StageOutput, iter_records
+
+COMPRESSIONS = ["gz"] + (["zst"] if record_io.zstandard else [])
+
+@pytest.mark.parametrize("suffix", COMPRESSIONS)
+@pytest.mark.parametrize("cut", [1, 3, 8, 15])
+def test_append_after_truncated_compressed_append(tmp_path, suffix, cut):
+    path = str(tmp_path / f"out.jsonl.{suffix}")
+    output = StageOutput(path)
+    for a in (1, 2, 3):
+        output.append({"a": a})
+    # Simulate a run killed while appending the last record.
+    os.truncate(path, os.path.getsize(path) - cut)
+
+    output = StageOutput(path)
+    output.append({"a": 4})
+    records = list(iter_records(path))
+
+    assert records[:2] == [{"a": 1}, {"a": 2}]
+    assert records[-1] == {"a": 4}
+
+@pytest.mark.parametrize("suffix", COMPRESSIONS)
+def test_iter_records_stops_at_corrupt_compressed_tail(tmp_path, suffix):
+    path = str(tmp_path / f"out.jsonl.{suffix}")
+    output = StageOutput(path)
+    for a in (1, 2):
+        output.append({"a": a})
+    size = os.path.getsize(path)
+    os.truncate(path, size - 15)
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 15)
+
+    assert list(iter_records(path))[:1] == [{"a": 1}]
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+test_retry_failed.py --- Checks that pipeline.py --retry-failed carries records
+recovered by OCR through the Deepseek stages.
+Version: 1.0.0
+
+Run with: python -m pytest test_retry_failed.py
+"""
+
+import os
+import sys
+import json
+import importlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools"))
+from stub_services import ollama_stub
+
+CERTIFICATE = ("Name of the deceased (in full): {name}\n"
+               "Date of death: May 1, 1866\n"
+               "Place of death: 29 Elizabeth Street\n"
+               "Cause of death: cholera\n")
+
+def ocr_record(filename, name):
+    return {"filename": filename, "ocr_text": CERTIFICATE.format(name=name), "ocr_confidence": 1.0}
+
+def filenames(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return {record["filename"] for record in json.load(f)}
+
+def test_retry_failed_processes_records_recovered_by_ocr(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("RETRY_FAILED_ONLY", raising=False)
+    os.makedirs("ocr")
+    os.makedirs("data")
+    # "done" went through every stage earlier; "recovered" failed OCR and sits in the queue.
+    with open("ocr/transcribed_json.json", "w", encoding="utf-8") as f:
+        json.dump([ocr_record("done", "John Smith")], f)
+    with open("data/dead_letters.json", "w", encoding="utf-8") as f:
+        json.dump([{"filename": "recovered", "stage": "document_ai_processor", "attempts": 1,
+                    "error": "ConnectionError"}], f)
+
+    import pipeline
+    import deepseek_request
+    import deepseek_name_request
+
+    ran = []
+
+    def run_module(module_name, profile_dir=None):
+        ran.append((module_name, os.environ.get("RETRY_FAILED_ONLY")))
+        if module_name == "document_ai_processor":
+            # OCR succeeds this time.
+            with open("ocr/transcribed_json.json", "w", encoding="utf-8") as f:
+                json.dump([ocr_record("done", "John Smith"), ocr_record("recovered", "Mary Sullivan")], f)
+        elif module_name in ("deepseek_name_request", "deepseek_request"):
+            importlib.import_module(module_name).main()
+
+    with ollama_stub() as stub:
+        url = stub.base_url + "/api/generate"
+        monkeypatch.setattr(deepseek_request, "OLLAMA_URL", url)
+        monkeypatch.setattr(deepseek_name_request, "OLLAMA_URL", url)
+        monkeypatch.setattr(pipeline, "run_module", run_module)
+        monkeypatch.setattr(pipeline.cholera_processor, "process_cholera_deaths", lambda: None)
+        pipeline.main(["--retry-failed"])
+
+    assert ("document_ai_processor", "1") in ran
+    assert ("deepseek_request", None) in ran
+    assert "recovered" in filenames("deepseek/deepseek_names.json")
+    assert "recovered" in filenames("deepseek/deepseek_response.json")
@@ -0,0 +1,289 @@
+"""
+benchmark.py - Offline throughput benchmarks for the pipeline stages.
+Version: 1.6.3
+
+Generates a synthetic corpus (see synthetic_corpus.py), starts local stub servers
+for Ollama and Document AI (see stub_services.py) and runs each stage in a fresh
+process against a fresh copy of its inputs. Reports records/sec, wall time and
+peak RSS per stage and size, saves the results as JSON and can compare them with
+a previous run.
+
+The Selenium downloader is not benchmarked; it needs a browser and the live site.
+
+Example:
+    python tools/benchmark.py --sizes 1000 10000 --latency 0.01 --compare old.json
+    python tools/benchmark.py --stages document_ai_processor --pages 4 --docai-latency 0.05 --split-pages
+    python tools/benchmark.py --stages document_ai_processor --docai-mode batch --docai-latency 0.01
+    python tools/benchmark.py --stages deepseek_request --latency 0.2 --batch-sizes 1 4 8 16
+    python tools/benchmark.py --stages deepseek_name_request deepseek_request --noise 0.2 --latency 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import importlib
+import multiprocessing
+from queue import Empty
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from record_io import COMPRESSION_SUFFIXES, convert, stage_path
+from synthetic_corpus import generate_corpus
+from stub_services import ollama_stub, document_ai_stub
+
+# stage -> (module, function, args, corpus inputs copied into the stage's workdir)
+STAGES = {
+    "document_ai_processor": ("document_ai_processor", "main", ([],), ["death_certificates"]),
+    "deepseek_name_request": ("deepseek_name_request", "main", (), ["ocr/transcribed_json.json"]),
+    "deepseek_request": ("deepseek_request", "main", (), ["ocr/transcribed_json.json"]),
+    "normalize_records": ("normalize_records", "main", (), ["deepseek/deepseek_response.json"]),
+    "deepseek_cholera_request": ("deepseek_cholera_request", "main", (), ["deepseek/deepseek_response.json"]),
+    "global_updater": ("global_updater", "update_global_file", ("./deepseek/deepseek_response.json",),
+                       ["data/complete_data.json", "deepseek/deepseek_response.json"]),
+    "cholera_processor": ("cholera_processor", "process_cholera_deaths", (),
+                          ["data/complete_data.json", "deepseek/deepseek_yes_no_response.json",
+                           "death_certificates"]),
+}
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB, or None if unavailable.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux and in bytes on macOS.
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+def stage_worker(stage, workdir, queue):
+    """
+    Runs one stage inside workdir. Executed in a fresh (spawned) process so the
+    peak RSS belongs to that stage alone. The stage configuration (stub URLs,
+    STAGE_FORMAT) arrives through the environment inherited from the parent, so
+    it is in place before the child re-imports this module.
+    """
+    module_name, func_name, args, _ = STAGES[stage]
+    # Stage file arguments follow the inputs run_stage converted for STAGE_FORMAT/STAGE_COMPRESSION.
+    args = tuple(stage_path(arg) if isinstance(arg, str) and arg.endswith(".json") else arg for arg in args)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    sys.stdout = open(os.devnull, "w")
+    try:
+        func = getattr(importlib.import_module(module_name), func_name)
+        start = time.perf_counter()
+        func(*args)
+        wall = time.perf_counter() - start
+        queue.put({"wall_s": wall, "peak_rss_mb": peak_rss_mb(), "error": None})
+    except BaseException as e:
+        queue.put({"wall_s": None, "peak_rss_mb": peak_rss_mb(), "error": f"{type(e).__name__}: {e}"})
+
+
+def wait_for_result(process, queue, poll_interval=1.0):
+    """
+    Returns the result the stage worker puts on queue, or an error result if the
+    worker dies without sending one (segfault, OOM kill).
+    """
+    while True:
+        try:
+            return queue.get(timeout=poll_interval)
+        except Empty:
+            if process.is_alive():
+                continue
+        # The worker has exited; a result it sent just before may still be in transit.
+        try:
+            return queue.get(timeout=poll_interval)
+        except Empty:
+            return {"wall_s": None, "peak_rss_mb": None,
+                    "error": f"benchmark worker exited with code {process.exitcode} without a result"}
+
+
+def link_or_copy_tree(src, dst):
+    """
+    Populates dst from src, hardlinking files where possible so large corpora set up quickly.
+    """
+    def link(s, d):
+        try:
+            os.link(s, d)
+        except OSError:
+            shutil.copy2(s, d)
+
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=link)
+    else:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # JSON inputs are rewritten by the stages, so they are always copied.
+        shutil.copy2(src, dst)
+
+
+def run_stage(stage, size, corpus_dir, work_root):
+    workdir = os.path.join(work_root, f"{stage}-{size}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    for relpath in STAGES[stage][3]:
+        src, dst = os.path.join(corpus_dir, relpath), os.path.join(workdir, relpath)
+        jsonl = os.environ.get("STAGE_FORMAT") == "jsonl"
+        compression = os.environ.get("STAGE_COMPRESSION", "")
+        if (jsonl or compression) and relpath.startswith(("ocr/", "deepseek/")):
+            # Same naming as record_io.stage_path() in the stage process.
+            convert(src, dst + ("l" if jsonl else "") + COMPRESSION_SUFFIXES.get(compression, ""))
+        else:
+            link_or_copy_tree(src, dst)
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=stage_worker, args=(stage, workdir, queue))
+    process.start()
+    result = wait_for_result(process, queue)
+    process.join()
+
+    result.update({"stage": stage, "size": size})
+    if result["wall_s"]:
+        result["records_per_s"] = size / result["wall_s"]
+    else:
+        result["records_per_s"] = None
+    return result
+
+
+def format_row(result, previous=None):
+    if result["error"]:
+        return f"{result['stage']:<26}{result['size']:>8}  ERROR {result['error']}"
+    rss = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "n/a"
+    row = f"{result['stage']:<26}{result['size']:>8}{result['wall_s']:>10.2f}{result['records_per_s']:>12.1f}{rss:>10}"
+    if previous and previous.get("records_per_s"):
+        change = (result["records_per_s"] / previous["records_per_s"] - 1) * 100
+        row += f"{change:>+9.1f}%"
+    return row
+
+
+def print_report(results, baseline=None):
+    baseline_index = {(r["stage"], r["size"]): r for r in (baseline or [])}
+    header = f"{'stage':<26}{'records':>8}{'wall s':>10}{'rec/s':>12}{'RSS MB':>10}"
+    if baseline:
+        header += f"{'vs prev':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(format_row(result, baseline_index.get((result["stage"], result["size"]))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline pipeline benchmarks.")
+    parser.add_argument('--sizes', nargs='*', type=int, default=[1000],
+                        help="Corpus sizes to benchmark (default: 1000; e.g. 1000 10000 100000).")
+    parser.add_argument('--stages', nargs='*', default=list(STAGES), choices=list(STAGES),
+                        help="Stages to run (default: all).")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Stub Ollama latency per request in seconds (default: 0).")
+    parser.add_argument('--docai-latency', type=float, default=0.0,
+                        help="Stub Document AI latency per request in seconds (default: 0).")
+    parser.add_argument('--format', choices=["json", "jsonl"], default="json",
+                        help="Stage output format passed to the stages as STAGE_FORMAT (default: json).")
+    parser.add_argument('--compression', choices=["", "gzip", "zstd"], default="",
+                        help="Stage output compression passed as STAGE_COMPRESSION (default: none).")
+    parser.add_argument('--no-stream', action='store_true',
+                        help="Wait for complete Ollama responses instead of streaming (OLLAMA_STREAM=0).")
+    parser.add_argument('--batch-sizes', nargs='*', type=int, default=[1],
+                        help="Records per prompt for deepseek_request (DEEPSEEK_BATCH_SIZE); "
+                             "each value is run as a separate deepseek_request[K=..] row (default: 1).")
+    parser.add_argument('--pages', type=int, default=1,
+                        help="Pages per synthetic PDF (default: 1).")
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help="Fraction of synthetic certificates with OCR errors (default: 0).")
+    parser.add_argument('--split-pages', action='store_true',
+                        help="OCR page by page in parallel (OCR_SPLIT_PAGES=1).")
+    parser.add_argument('--docai-mode', choices=["online", "batch"], default="online",
+                        help="Document AI online requests or batch jobs against the stub (default: online).")
+    parser.add_argument('--workdir', default="./bench_work",
+                        help="Scratch directory for corpora and stage runs (default: ./bench_work).")
+    parser.add_argument('--output', default=None,
+                        help="Results JSON path (default: <workdir>/results-<timestamp>.json).")
+    parser.add_argument('--compare', default=None, help="Previous results JSON to compare against.")
+    parser.add_argument('--keep', action='store_true', help="Keep the stage workdirs after the run.")
+    args = parser.parse_args()
+
+    work_root = os.path.abspath(args.workdir)
+    os.makedirs(work_root, exist_ok=True)
+    results = []
+
+    with ollama_stub(args.latency) as ollama, document_ai_stub(args.docai_latency) as docai:
+        env = {
+            "OLLAMA_URL": ollama.base_url + "/api/generate",
+            "DOCUMENT_AI_ENDPOINT": docai.base_url + "/v1/projects/bench/locations/us/processors/stub:process",
+            "DOCUMENT_AI_ACCESS_TOKEN": "stub-token",
+            "STAGE_FORMAT": args.format,
+            "STAGE_COMPRESSION": args.compression,
+            "OLLAMA_STREAM": "0" if args.no_stream else "1",
+            "OCR_SPLIT_PAGES": "1" if args.split_pages else "0",
+            "DOCUMENT_AI_MODE": args.docai_mode,
+            "DOCUMENT_AI_BATCH_BUCKET": "gs://bench/ocr",
+            "DOCUMENT_AI_POLL_INTERVAL": "0.2",
+            "GCS_API_URL": docai.base_url,
+        }
+        os.environ.update(env)
+        for size in args.sizes:
+            corpus_name = f"corpus-{size}"
+            if args.pages != 1:
+                corpus_name += f"-p{args.pages}"
+            if args.noise:
+                corpus_name += f"-n{args.noise:g}"
+            corpus_dir = os.path.join(work_root, corpus_name)
+            if not os.path.exists(os.path.join(corpus_dir, "data", "complete_data.json")):
+                print(f"Generating synthetic corpus of {size} records in {corpus_dir}...")
+                generate_corpus(corpus_dir, size, pages_per_pdf=args.pages, noise=args.noise)
+            for stage in args.stages:
+                batch_sizes = args.batch_sizes if stage == "deepseek_request" else [None]
+                for batch_size in batch_sizes:
+                    label = stage
+                    if batch_size is not None:
+                        os.environ["DEEPSEEK_BATCH_SIZE"] = str(batch_size)
+                        if batch_sizes != [1]:
+                            label = f"{stage}[K={batch_size}]"
+                    print(f"Running {label} on {size} records...")
+                    result = run_stage(stage, size, corpus_dir, work_root)
+                    result["stage"] = label
+                    results.append(result)
+                    if not args.keep:
+                        shutil.rmtree(os.path.join(work_root, f"{stage}-{size}"), ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", [])
+    print()
+    print_report(results, baseline)
+
+    output = args.output or os.path.join(work_root, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "latency": args.latency,
+            "docai_latency": args.docai_latency,
+            "format": args.format,
+            "compression": args.compression,
+            "pages": args.pages,
+            "split_pages": args.split_pages,
+            "noise": args.noise,
+            "docai_mode": args.docai_mode,
+            "stream": not args.no_stream,
+            "batch_sizes": args.batch_sizes,
+            "results": results
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,203 @@
 """
 savecode.py - Save Python code from directories and files into one output file.
-Version: 1.2.1
+Version: 1.3.1
+
+Files are read by a pool of --workers threads and written to the output in order
+as they become ready. With --incremental the size, mtime and SHA-256 of every
+file are kept in <output>.cache.json together with where its section sits in the
+output; on the next run unchanged files are copied from the previous output
+instead of being re-read. --incremental also skips paths matched by .gitignore
+files (as does --gitignore on its own).
 """
 
 import os
+import json
+import fnmatch
+import hashlib
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+READ_WORKERS = 8
+
+def load_gitignore(dirpath):
+    """
+    Reads the patterns of dirpath/.gitignore as (pattern, anchored, dir_only)
+    tuples. Negated patterns (!pattern) are not supported and are ignored.
+    """
+    patterns = []
+    try:
+        with open(os.path.join(dirpath, ".gitignore"), 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return patterns
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith("!"):
+            continue
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        # A slash anywhere but the end ties the pattern to the .gitignore's directory.
+        anchored = "/" in line
+        patterns.append((line.lstrip("/"), anchored, dir_only))
+    return patterns
+
+def is_ignored(path, is_dir, ignore_rules):
+    """
+    True if path matches one of ignore_rules, a list of (base_dir, patterns).
+    """
+    name = os.path.basename(path)
+    for base_dir, patterns in ignore_rules:
+        rel_path = os.path.relpath(path, base_dir).replace(os.sep, "/")
+        if rel_path.startswith("../"):
+            continue
+        for pattern, anchored, dir_only in patterns:
+            if dir_only and not is_dir:
+                continue
+            if fnmatch.fnmatch(rel_path if anchored else name, pattern):
+                return True
+    return False
 
-def gather_py_files(root_dir, skip_dirs=None):
+def gather_py_files(root_dir, skip_dirs=None, use_gitignore=False):
     """
     Recursively gather all .py files under root_dir,
-    skipping any directories listed in skip_dirs.
+    skipping any directories listed in skip_dirs
+    (and paths matched by .gitignore files if use_gitignore is set).
     """
     skip_dirs = set(skip_dirs or [])
     py_files = []
     current_file = os.path.abspath(__file__)
+    rules_by_dir = {}
     for dirpath, dirnames, filenames in os.walk(root_dir):
+        ignore_rules = []
+        if use_gitignore:
+            # Rules of the parent directories plus this directory's own .gitignore.
+            ignore_rules = list(rules_by_dir.get(os.path.dirname(dirpath), []))
+            patterns = load_gitignore(dirpath)
+            if patterns:
+                ignore_rules.append((dirpath, patterns))
+            rules_by_dir[dirpath] = ignore_rules
         # Remove directories that should be skipped so os.walk won’t traverse them.
-        dirnames[:] = [d for d in dirnames if d not in skip_dirs]
+        dirnames[:] = [d for d in dirnames if d not in skip_dirs
+                       and not is_ignored(os.path.join(dirpath, d), True, ignore_rules)]
         for fname in filenames:
             if fname.endswith(".py"):
                 file_path = os.path.join(dirpath, fname)
+                if is_ignored(file_path, False, ignore_rules):
+                    continue
                 # Skip the current script (savecode.py)
                 if os.path.abspath(file_path) == current_file:
                     continue
                 py_files.append(file_path)
     return py_files
 
-def save_code(py_files, output_file):
+def read_section(file):
+    """
+    Returns (section bytes, sha256 of the file) for one file. A section is the
+    file's code preceded by a header (with the file path) and followed by blank lines.
+    Newlines are written as os.linesep, as a text-mode write would (CRLF on Windows).
+    """
+    with open(file, 'rb') as f:
+        data = f.read()
+    code = data.decode('utf-8').replace("\r\n", "\n").replace("\r", "\n")
+    section = f"\nFile: {file}\n\n{code}\n\n".replace("\n", os.linesep).encode('utf-8')
+    return section, hashlib.sha256(data).hexdigest()
+
+def iter_in_order(func, items, workers=READ_WORKERS):
+    """
+    Yields (item, result or exception) in the order of items while up to workers
+    calls of func run ahead in a thread pool. Only a bounded window of results
+    is held in memory.
+    """
+    window = deque()
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            window.append((item, pool.submit(func, item)))
+            if len(window) >= workers * 4:
+                yield finish(window.popleft())
+        while window:
+            yield finish(window.popleft())
+
+def finish(entry):
+    item, future = entry
+    try:
+        return item, future.result()
+    except Exception as e:
+        return item, e
+
+def cache_path(output_file):
+    return output_file + ".cache.json"
+
+def load_cache(output_file):
+    """
+    Returns the cached file entries if the previous output is still the one the
+    cache describes, otherwise an empty dict.
+    """
+    try:
+        with open(cache_path(output_file), 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        stat = os.stat(output_file)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("output_size") != stat.st_size or cache.get("output_mtime_ns") != stat.st_mtime_ns:
+        return {}
+    return cache.get("files", {})
+
+def save_cache(output_file, entries):
+    stat = os.stat(output_file)
+    cache = {"output_size": stat.st_size, "output_mtime_ns": stat.st_mtime_ns, "files": entries}
+    tmp_path = cache_path(output_file) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path(output_file))
+
+def save_code(py_files, output_file, incremental=False, workers=READ_WORKERS):
     """
     Save the code from each Python file in py_files to output_file.
     Each file's code is preceded by a header (with the file path)
     and separated by blank lines.
+    With incremental set, files whose size and mtime match the cache are copied
+    from the previous output. Returns (files saved, files re-read).
     """
-    with open(output_file, 'w', encoding='utf-8') as out:
-        for file in py_files:
-            try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    header = f"\nFile: {file}\n\n"
-                    out.write(header)
-                    out.write(f.read())
-                    out.write("\n\n")
-            except Exception as e:
-                print(f"Error reading {file}: {e}")
+    cached = load_cache(output_file) if incremental else {}
+    previous = open(output_file, 'rb') if cached else None
+
+    def load(file):
+        stat = os.stat(file)
+        entry = cached.get(file)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return None, entry["sha256"], stat
+        section, digest = read_section(file)
+        return section, digest, stat
+
+    entries = {}
+    reread = 0
+    tmp_path = output_file + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as out:
+            for file, result in iter_in_order(load, py_files, workers):
+                if isinstance(result, Exception):
+                    print(f"Error reading {file}: {result}")
+                    continue
+                section, digest, stat = result
+                entry = cached.get(file)
+                if section is None or (entry and entry["sha256"] == digest):
+                    # Unchanged: copy the section from the previous output.
+                    previous.seek(entry["offset"])
+                    section = previous.read(entry["length"])
+                else:
+                    reread += 1
+                entries[file] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest,
+                                 "offset": out.tell(), "length": len(section)}
+                out.write(section)
+    finally:
+        if previous:
+            previous.close()
+    os.replace(tmp_path, output_file)
+    if incremental:
+        save_cache(output_file, entries)
+    return len(entries), reread
 
 def main():
     parser = argparse.ArgumentParser(
@@ -70,13 +226,29 @@ def main():
         default=['rnn_src'],
         help="Subdirectory names to skip (default: ['rnn_src'])."
     )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help="Only re-read files changed since the last run (cache in <output>.cache.json); implies --gitignore."
+    )
+    parser.add_argument(
+        '--gitignore',
+        action='store_true',
+        help="Skip files and directories matched by .gitignore patterns."
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=READ_WORKERS,
+        help=f"Number of threads reading files (default: {READ_WORKERS})."
+    )
     args = parser.parse_args()
 
     all_py_files = []
 
     # Gather Python files from specified directories.
     for root in args.roots:
-        all_py_files.extend(gather_py_files(root, args.skip))
+        all_py_files.extend(gather_py_files(root, args.skip, use_gitignore=args.gitignore or args.incremental))
 
     # Add individual Python files, ensuring they exist and have the correct extension.
     for file in args.files:
@@ -95,7 +267,7 @@ def main():
     else:
         output_file = args.output
 
-    save_code(all_py_files, output_file)
+    saved, reread = save_code(all_py_files, output_file, incremental=args.incremental, workers=args.workers)
 
     # Print the list of saved files with colors.
     green = "\033[1;32m"
@@ -105,6 +277,8 @@ def main():
     white = "\033[1;37m"
     reset = "\033[0m"
     print(f"\n{cyan}Saved code from {len(all_py_files)} files to {output_file}{reset}")
+    if args.incremental:
+        print(f"{cyan}{reread} new or changed files re-read, {saved - reread} reused{reset}")
     print(f"\n{green}Files saved:{reset}")
     for f in all_py_files:
         print(f"{blue}- {f}{reset}")
@@ -0,0 +1,86 @@
+"""
+storage_benchmark.py - Compare read/write time and size of the stage file formats.
+Version: 1.0.0
+
+Writes the OCR output and the global file of a synthetic corpus in every
+combination of JSON array / JSON Lines and no compression / gzip / zstd using
+record_io, reads each back as a stream, and reports size, write time and read time.
+
+Example:
+    python tools/storage_benchmark.py --size 10000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+
+import record_io
+from synthetic_corpus import generate_corpus
+
+SOURCES = ["ocr/transcribed_json.json", "data/complete_data.json"]
+FORMATS = [".json", ".jsonl"]
+
+
+def available_compressions():
+    compressions = ["", "gzip"]
+    if record_io.zstandard is not None:
+        compressions.append("zstd")
+    return compressions
+
+
+def measure(records, file_path):
+    start = time.perf_counter()
+    record_io.write_records(file_path, records)
+    write_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    count = sum(1 for _ in record_io.iter_records(file_path))
+    read_s = time.perf_counter() - start
+    return {
+        "file": os.path.basename(file_path),
+        "size_mb": os.path.getsize(file_path) / (1024 * 1024),
+        "write_s": write_s,
+        "read_s": read_s,
+        "records": count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stage file formats and compression.")
+    parser.add_argument('-n', '--size', type=int, default=10000, help="Corpus size (default: 10000).")
+    parser.add_argument('--workdir', default="./bench_work", help="Scratch directory (default: ./bench_work).")
+    args = parser.parse_args()
+
+    corpus_dir = os.path.join(os.path.abspath(args.workdir), f"corpus-{args.size}")
+    if not os.path.exists(os.path.join(corpus_dir, "data", "complete_data.json")):
+        print(f"Generating synthetic corpus of {args.size} records in {corpus_dir}...")
+        generate_corpus(corpus_dir, args.size)
+    out_dir = os.path.join(os.path.abspath(args.workdir), f"storage-{args.size}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    if record_io.zstandard is None:
+        print("zstandard is not installed; skipping zstd.")
+
+    header = f"{'file':<34}{'size MB':>10}{'write s':>10}{'read s':>10}"
+    print(header)
+    print("-" * len(header))
+    for source in SOURCES:
+        records = record_io.load_records(os.path.join(corpus_dir, source))
+        stem = os.path.splitext(os.path.basename(source))[0]
+        for extension in FORMATS:
+            for compression in available_compressions():
+                suffix = record_io.COMPRESSION_SUFFIXES.get(compression, "")
+                result = measure(records, os.path.join(out_dir, stem + extension + suffix))
+                print(f"{result['file']:<34}{result['size_mb']:>10.2f}{result['write_s']:>10.3f}{result['read_s']:>10.3f}")
+        print()
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+stub_services.py - Local stand-ins for Ollama and Document AI used by the benchmarks.
+Version: 1.5.0
+
+Both stubs answer from the synthetic certificates' printed labels, so results are
+deterministic and the pipeline can run without network access or credentials.
+Each stub sleeps for a configurable latency per request (per page for Document AI)
+to mimic the real service; the Ollama stub can stream its answer token by token.
+
+The Document AI stub also covers the batch job lifecycle: it serves the parts of
+the Cloud Storage JSON API that document_ai_batch.py uses (upload, list, download)
+from memory, accepts :batchProcess and reports the operation as done once the
+per-page latency for all of its documents has passed.
+"""
+
+import re
+import json
+import time
+import base64
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Printed labels on the synthetic certificates -> extracted field.
+FIELD_LABELS = {
+    "person_name": "Name of the deceased (in full):",
+    "death_date": "Date of death:",
+    "death_location": "Place of death:",
+    "cause_of_death": "Cause of death:",
+}
+# OCR confusions (see synthetic_corpus.OCR_CONFUSIONS) that the large model reads through.
+LOOKALIKES = {"e": "ec", "a": "ao", "h": "hb", "l": "l1", "o": "o0a", "i": "i1", "s": "s5", "n": "nu",
+              "c": "ce", "u": "un"}
+VALUE = r"\s*([^\\\n\"]+)"
+FILENAME_PATTERN = re.compile(r'"filename":\s*"([^"]*)"')
+PDF_TEXT_PATTERN = re.compile(rb"\(((?:\\.|[^\\)])*)\) Tj")
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page\b(?!s)")
+
+
+def tolerant_label(label):
+    parts = []
+    for ch in label:
+        if ch == "m":
+            parts.append("(?:m|rn)")
+        elif ch.lower() in LOOKALIKES:
+            parts.append("[" + LOOKALIKES[ch.lower()] + ch.upper() + "]")
+        else:
+            parts.append(re.escape(ch))
+    return "".join(parts)
+
+
+FIELD_PATTERNS = {key: re.compile(re.escape(label) + VALUE) for key, label in FIELD_LABELS.items()}
+TOLERANT_PATTERNS = {key: re.compile(tolerant_label(label) + VALUE) for key, label in FIELD_LABELS.items()}
+
+
+def extract_fields(text, keys, tolerant=False):
+    patterns = TOLERANT_PATTERNS if tolerant else FIELD_PATTERNS
+    fields = {}
+    for key in keys:
+        pattern = patterns.get(key)
+        # The prompt instructions may quote a label too; the record text comes last.
+        matches = pattern.findall(text) if pattern else []
+        fields[key] = matches[-1].strip() if matches else ""
+    return fields
+
+
+def extract_answer(prompt, keys, tolerant=False):
+    """
+    One object per record in the prompt. Batched prompts (the schema asks for a
+    filename) list several records; each is answered from its own part of the prompt.
+    """
+    if "filename" not in keys:
+        return [extract_fields(prompt, keys, tolerant)]
+    matches = list(FILENAME_PATTERN.finditer(prompt))
+    answer = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(prompt)
+        fields = extract_fields(prompt[match.end():end], [key for key in keys if key != "filename"], tolerant)
+        answer.append({"filename": match.group(1), **fields})
+    return answer
+
+
+def pdf_text(pdf_bytes):
+    """
+    Returns the text lines drawn by a PDF written with synthetic_corpus.make_pdf().
+    """
+    lines = []
+    for raw in PDF_TEXT_PATTERN.findall(pdf_bytes):
+        lines.append(re.sub(rb"\\(.)", rb"\1", raw).decode("latin-1"))
+    return lines
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def send_bytes(self, body, status=200, content_type="application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        self.send_bytes(json.dumps(data).encode("utf-8"), status, "application/json")
+
+
+class OllamaStubHandler(StubHandler):
+    """
+    Answers POST /api/generate with the fields named in the request's JSON schema.
+
+    Generation is modelled as PROMPT_TOKENS of prompt evaluation before the first
+    token, REASONING_TOKENS tokens of <think> text (skipped when the request sets
+    "think": false), the answer at ANSWER_CHARS_PER_TOKEN characters per token and
+    TRAILING_TOKENS of whitespace, as models constrained to a JSON format tend to
+    emit after the object. Each token takes latency / TOKENS_PER_LATENCY seconds.
+    Models other than LARGE_MODEL run SMALL_MODEL_SPEEDUP times faster but only
+    read labels printed without OCR errors; LARGE_MODEL reads through them.
+    Streamed requests get one NDJSON chunk per token; generation stops when the
+    client disconnects or options.num_predict tokens have been produced.
+    """
+    PROMPT_TOKENS = 10
+    REASONING_TOKENS = 20
+    ANSWER_CHARS_PER_TOKEN = 10
+    TRAILING_TOKENS = 10
+    TOKENS_PER_LATENCY = 40
+    LARGE_MODEL = "deepseek-r1:32b"
+    SMALL_MODEL_SPEEDUP = 4
+    protocol_version = "HTTP/1.1"  # chunked streaming, like Ollama
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_json({"error": "not found"}, status=404)
+            return
+        payload = self.read_json()
+        schema = payload.get("format") or {}
+        keys = list(schema.get("items", schema).get("properties", {}).keys())
+        large = payload.get("model", self.LARGE_MODEL) == self.LARGE_MODEL
+        answer = json.dumps(extract_answer(payload.get("prompt", ""), keys, tolerant=large))
+
+        tokens = []
+        if payload.get("think") is not False:
+            tokens += ["<think>"] + ["Reading the certificate. "] * (self.REASONING_TOKENS - 2) + ["</think>"]
+        step = self.ANSWER_CHARS_PER_TOKEN
+        tokens += [answer[i:i + step] for i in range(0, len(answer), step)]
+        tokens += ["\n"] * self.TRAILING_TOKENS
+        num_predict = (payload.get("options") or {}).get("num_predict")
+        done_reason = "stop"
+        if num_predict and num_predict > 0 and len(tokens) > num_predict:
+            tokens, done_reason = tokens[:num_predict], "length"
+        token_time = self.latency / self.TOKENS_PER_LATENCY / (1 if large else self.SMALL_MODEL_SPEEDUP)
+
+        if not payload.get("stream", True):
+            time.sleep(token_time * (self.PROMPT_TOKENS + len(tokens)))
+            self.send_json({
+                "model": payload.get("model", ""),
+                "response": "".join(tokens),
+                "done": True,
+                "done_reason": done_reason,
+                "eval_count": len(tokens)
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(token_time * self.PROMPT_TOKENS)
+        try:
+            for token in tokens:
+                time.sleep(token_time)
+                self.send_chunk({"model": payload.get("model", ""), "response": token, "done": False})
+            self.send_chunk({"model": payload.get("model", ""), "response": "", "done": True,
+                             "done_reason": done_reason, "eval_count": len(tokens)})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client has what it needs and closed the connection.
+            self.close_connection = True
+
+    def send_chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+
+def ocr_document(content):
+    """
+    The stub's OCR result for a PDF: its text lines and one page entry per page.
+    """
+    page_count = max(1, len(PDF_PAGE_PATTERN.findall(content)))
+    return {
+        "text": "\n".join(pdf_text(content)) + "\n",
+        "pages": [{"pageNumber": n, "layout": {"confidence": 0.95}} for n in range(1, page_count + 1)]
+    }
+
+
+def split_gcs_uri(uri):
+    bucket, _, name = uri[len("gs://"):].partition("/")
+    return bucket, name
+
+
+class DocumentAIStubHandler(StubHandler):
+    """
+    Answers POST .../processors/<id>:process with the PDF's text as the OCR result,
+    plus :batchProcess, operation polling and the Cloud Storage calls batch mode needs.
+    """
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/upload/storage/v1/b/"):
+            self.upload_object(url)
+        elif url.path.endswith(":batchProcess"):
+            self.batch_process(url)
+        elif url.path.endswith(":process"):
+            payload = self.read_json()
+            content = base64.b64decode(payload.get("rawDocument", {}).get("content", ""))
+            document = ocr_document(content)
+            time.sleep(self.latency * len(document["pages"]))
+            self.send_json({"document": document})
+        else:
+            self.send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/storage/v1/b/"):
+            self.get_objects(url)
+        elif "/operations/" in url.path:
+            self.get_operation(url.path[len("/v1/"):])
+        else:
+            self.send_json({"error": {"message": "not found"}}, status=404)
+
+    # Cloud Storage JSON API (in memory)
+
+    def bucket(self, name):
+        with self.state_lock:
+            return self.state.setdefault("buckets", {}).setdefault(name, {})
+
+    def upload_object(self, url):
+        bucket = url.path.split("/")[5]
+        name = parse_qs(url.query).get("name", [""])[0]
+        self.bucket(bucket)[name] = self.read_body()
+        self.send_json({"bucket": bucket, "name": name})
+
+    def get_objects(self, url):
+        parts = url.path.split("/")
+        objects = self.bucket(parts[4])
+        if len(parts) > 6:
+            name = unquote("/".join(parts[6:]))
+            if name not in objects:
+                self.send_json({"error": {"message": "not found"}}, status=404)
+            else:
+                self.send_bytes(objects[name])
+            return
+        prefix = parse_qs(url.query).get("prefix", [""])[0]
+        self.send_json({"items": [{"name": name} for name in sorted(objects) if name.startswith(prefix)]})
+
+    # Document AI batch jobs
+
+    def batch_process(self, url):
+        payload = self.read_json()
+        documents = payload.get("inputDocuments", {}).get("gcsDocuments", {}).get("documents", [])
+        output_uri = payload.get("documentOutputConfig", {}).get("gcsOutputConfig", {}).get("gcsUri", "")
+        with self.state_lock:
+            operations = self.state.setdefault("operations", {})
+            operation_id = str(len(operations) + 1)
+        location = url.path[len("/v1/"):].split("/processors/")[0]
+        operation_name = f"{location}/operations/{operation_id}"
+
+        out_bucket, out_prefix = split_gcs_uri(output_uri.rstrip("/"))
+        statuses, total_pages = [], 0
+        for index, entry in enumerate(documents):
+            in_bucket, in_name = split_gcs_uri(entry.get("gcsUri", ""))
+            content = self.bucket(in_bucket).get(in_name)
+            if content is None:
+                statuses.append({"inputGcsSource": entry.get("gcsUri"),
+                                 "status": {"code": 5, "message": "input not found"}})
+                continue
+            document = ocr_document(content)
+            total_pages += len(document["pages"])
+            destination = f"{out_prefix}/{operation_id}/{index}"
+            stem = in_name.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+            self.bucket(out_bucket)[f"{destination}/{stem}-0.json"] = json.dumps(document).encode("utf-8")
+            statuses.append({"inputGcsSource": entry.get("gcsUri"), "status": {},
+                             "outputGcsDestination": f"gs://{out_bucket}/{destination}"})
+        with self.state_lock:
+            operations[operation_name] = {
+                "ready_at": time.time() + self.latency * total_pages,
+                "statuses": statuses
+            }
+        self.send_json({"name": operation_name})
+
+    def get_operation(self, name):
+        with self.state_lock:
+            operation = self.state.get("operations", {}).get(name)
+        if operation is None:
+            self.send_json({"error": {"message": "not found"}}, status=404)
+            return
+        done = time.time() >= operation["ready_at"]
+        result = {
+            "name": name,
+            "done": done,
+            "metadata": {"state": "SUCCEEDED" if done else "RUNNING"}
+        }
+        if done:
+            result["metadata"]["individualProcessStatuses"] = operation["statuses"]
+        self.send_json(result)
+
+
+class StubServer:
+    """
+    Runs a stub handler on a background thread. Use as a context manager.
+    """
+    def __init__(self, handler_cls, latency=0.0, host="127.0.0.1", port=0):
+        handler = type(handler_cls.__name__, (handler_cls,),
+                       {"latency": latency, "state": {}, "state_lock": threading.Lock()})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def ollama_stub(latency=0.0):
+    return StubServer(OllamaStubHandler, latency=latency)
+
+
+def document_ai_stub(latency=0.0):
+    return StubServer(DocumentAIStubHandler, latency=latency)
@@ -0,0 +1,215 @@
+"""
+synthetic_corpus.py - Generate a synthetic death-certificate corpus for benchmarks.
+Version: 1.1.0
+
+Writes the same directory layout the pipeline uses (records/, death_certificates/,
+ocr/, deepseek/, data/) so every stage can run against it offline:
+  - one small text PDF per certificate
+  - OCR output as produced by document_ai_processor.py
+  - LLM outputs as produced by the deepseek_* stages
+  - the consolidated data/complete_data.json
+The corpus is deterministic for a given size and seed. With noise > 0 that
+fraction of certificates gets OCR-style character confusions in its text, so the
+rule extractor and the model see some hard records; the ground truth is unchanged.
+"""
+
+import os
+import json
+import random
+import argparse
+
+FIRST_NAMES = [
+    "John", "Mary", "Patrick", "Bridget", "James", "Margaret", "Michael", "Catherine",
+    "William", "Ellen", "Thomas", "Ann", "Henry", "Elizabeth", "Charles", "Sarah",
+    "George", "Johanna", "Frederick", "Julia", "Peter", "Rosanna", "Hugh", "Honora"
+]
+LAST_NAMES = [
+    "Murphy", "Kelly", "O'Brien", "Sullivan", "Smith", "Walsh", "McCarthy", "Byrne",
+    "Ryan", "Connor", "Schmidt", "Muller", "Meyer", "Brown", "Johnson", "Doyle",
+    "Lynch", "Quinn", "Fitzgerald", "Weber", "Fischer", "Daly", "Burke", "Nolan"
+]
+STREETS = [
+    "Mulberry St", "Baxter St", "Mott St", "Cherry St", "Water St", "Greenwich St",
+    "Avenue A", "First Avenue", "Elizabeth St", "Washington St", "Hudson St", "Pearl St"
+]
+MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July",
+    "August", "September", "October", "November", "December"
+]
+# (cause of death, cholera_death label)
+CAUSES = [
+    ("Asiatic cholera", "yes"), ("Cholera morbus", "yes"), ("Cholera infantum", "yes"),
+    ("Chronic diarrhoea", "yes"), ("Phthisis pulmonalis", "unknown"), ("Pneumonia", "unknown"),
+    ("Typhoid fever", "no"), ("Convulsions", "no"), ("Old age", "no"), ("Marasmus", "unknown"),
+    ("Consumption", "unknown"), ("Diptheria", "no")
+]
+# Characters OCR tends to confuse
+OCR_CONFUSIONS = {"e": "c", "a": "o", "h": "b", "m": "rn", "l": "1", "o": "0", "i": "1", "s": "5", "n": "u"}
+
+
+def pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """
+    Builds a minimal valid PDF. pages is a list of pages, each a list of text lines.
+    """
+    page_count = len(pages)
+    font_id = 3 + 2 * page_count
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count)), page_count
+        ),
+    ]
+    for i, lines in enumerate(pages):
+        content = "BT /F1 10 Tf 50 750 Td 12 TL " + " ".join(f"({pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def make_certificate(index, rng):
+    """
+    Returns the ground-truth fields for one synthetic certificate.
+    """
+    year = rng.choice([1865, 1866, 1866, 1866, 1867])
+    cause, cholera = rng.choice(CAUSES)
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    ward = rng.randint(1, 22)
+    return {
+        "filename": f"{year}-{index:06d}",
+        "person_name": name,
+        "age": rng.randint(0, 85),
+        "death_date": f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {year}",
+        "death_location": f"No. {rng.randint(1, 400)} {rng.choice(STREETS)}, {ward} Ward",
+        "cause_of_death": cause,
+        "cholera_death": cholera,
+    }
+
+
+def certificate_lines(cert):
+    """
+    The printed form of a certificate as OCR would read it.
+    """
+    return [
+        "CITY AND COUNTY OF NEW YORK",
+        "CERTIFICATE AND RECORD OF DEATH",
+        f"of {cert['person_name']}",
+        f"1. Name of the deceased (in full): {cert['person_name']}",
+        f"2. Age: {cert['age']} years",
+        "3. Color: White",
+        f"4. Date of death: {cert['death_date']}",
+        f"5. Place of death: {cert['death_location']}",
+        f"6. Cause of death: {cert['cause_of_death']}",
+        "I hereby certify that I attended the deceased, and that the cause of death was as above stated.",
+        "Witness my hand this day, M.D.",
+    ]
+
+
+def garble(lines, rng, rate=0.15):
+    """
+    Applies OCR confusions to the numbered form lines.
+    """
+    garbled = []
+    for line in lines:
+        if line[:1].isdigit():
+            line = "".join(OCR_CONFUSIONS.get(ch, ch) if rng.random() < rate else ch for ch in line)
+        garbled.append(line)
+    return garbled
+
+
+def write_json(data, file_path):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def generate_corpus(out_dir, size, seed=1866, pages_per_pdf=1, noise=0.0):
+    """
+    Writes a corpus of `size` certificates under out_dir and returns the ground truth list.
+    """
+    rng = random.Random(seed)
+    certificates = [make_certificate(i, rng) for i in range(size)]
+    noise_rng = random.Random(seed + 1)
+
+    pdf_dir = os.path.join(out_dir, "death_certificates")
+    os.makedirs(pdf_dir, exist_ok=True)
+    saved_files, ocr, names, responses, yes_no, complete = [], [], [], [], [], []
+    for cert in certificates:
+        lines = certificate_lines(cert)
+        if noise and noise_rng.random() < noise:
+            lines = garble(lines, noise_rng)
+        per_page = max(1, -(-len(lines) // pages_per_pdf))
+        pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)]
+        with open(os.path.join(pdf_dir, cert["filename"] + ".pdf"), "wb") as f:
+            f.write(make_pdf(pages))
+
+        url = f"https://a860-historicalvitalrecords.nyc.gov/view/{cert['filename']}"
+        ocr_text = "\n".join(lines)
+        saved_files.append({"output filename": cert["filename"], "certificate_url": url})
+        ocr.append({"filename": cert["filename"], "ocr_text": ocr_text})
+        names.append({"filename": cert["filename"], "person_name": cert["person_name"]})
+        responses.append({
+            "filename": cert["filename"],
+            "death_date": cert["death_date"],
+            "death_location": cert["death_location"],
+            "cause_of_death": cert["cause_of_death"]
+        })
+        yes_no.append({
+            "filename": cert["filename"],
+            "cause_of_death": cert["cause_of_death"],
+            "cholera_death": cert["cholera_death"]
+        })
+        complete.append({
+            "filename": cert["filename"],
+            "person_name": cert["person_name"],
+            "certificate_url": url,
+            "ocr_text": ocr_text,
+            "death_date": cert["death_date"],
+            "death_location": cert["death_location"],
+            "cause_of_death": cert["cause_of_death"],
+            "cholera_death": cert["cholera_death"]
+        })
+
+    write_json(saved_files, os.path.join(out_dir, "records", "saved_files.json"))
+    write_json(ocr, os.path.join(out_dir, "ocr", "transcribed_json.json"))
+    write_json(names, os.path.join(out_dir, "deepseek", "deepseek_names.json"))
+    write_json(responses, os.path.join(out_dir, "deepseek", "deepseek_response.json"))
+    write_json(yes_no, os.path.join(out_dir, "deepseek", "deepseek_yes_no_response.json"))
+    write_json(complete, os.path.join(out_dir, "data", "complete_data.json"))
+    return certificates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus for the benchmark suite.")
+    parser.add_argument('-n', '--size', type=int, default=1000, help="Number of certificates (default: 1000).")
+    parser.add_argument('-o', '--output', default="./bench_corpus", help="Output directory (default: ./bench_corpus).")
+    parser.add_argument('--seed', type=int, default=1866, help="Random seed (default: 1866).")
+    parser.add_argument('--pages', type=int, default=1, help="Pages per PDF (default: 1).")
+    parser.add_argument('--noise', type=float, default=0.0,
+                        help="Fraction of certificates with OCR errors in their text (default: 0).")
+    args = parser.parse_args()
+
+    generate_corpus(args.output, args.size, seed=args.seed, pages_per_pdf=args.pages, noise=args.noise)
+    print(f"Wrote {args.size} synthetic certificates to {args.output}")
+
+
+if __name__ == "__main__":
+    main()